@@ -1,198 +1,925 @@
+import hashlib
+import json
 import math
-from coefficient_table import crossCorrelationCoefficientTable
-from hydrologic_region_table import hydrologicRegionsTable
+import re
+from functools import lru_cache
+from time import perf_counter
+import metrics
+import settings
+from weighting_errors import DuplicateCodeError, DuplicateMethodError, InvalidAEPCodeError, InvalidMethodCodeError, InvalidParameterError, InvalidRegionError, MismatchedAEPError, MismatchedLengthError, MissingCodeError, MissingCoefficientError, MissingSEPError, NonFiniteResultError, NonFiniteValueError, NonPositiveEstimateError, NonPositiveSEPError, NotPositiveDefiniteError, TooFewMethodsError, WeightingError
+
+#NumPy is only imported by the batch functions, so the scalar weighting functions can be imported and called without it
+
+validMethodCodes = ["BC", "AC", "BW", "RS"]
+
+#Builds a flat index of the cross-correlation coefficients keyed by (regressionRegionCode, methodCode1, methodCode2, AEP), ex. ("GC1829", "AC", "BC", "Q0.2")
+#Both orders of each method pair are indexed so that lookups do not depend on the order of the codes
+def buildCoefficientIndex(coefficientTable, regionsTable):
+    coefficientIndex = {}
+    reversedPairs = {}
+    for hydrologicRegion, regressionRegionCodes in regionsTable.items():
+        for methodPair, coefficients in coefficientTable.get(hydrologicRegion, {}).items():
+            methodCode1, methodCode2 = methodPair.split(",")
+            for AEP, coefficient in coefficients.items():
+                for regressionRegionCode in regressionRegionCodes:
+                    coefficientIndex[(regressionRegionCode, methodCode1, methodCode2, AEP)] = coefficient
+                    reversedPairs[(regressionRegionCode, methodCode2, methodCode1, AEP)] = coefficient
+    for key, coefficient in reversedPairs.items():
+        coefficientIndex.setdefault(key, coefficient)
+    return coefficientIndex
+
+#Short hash of the coefficient and region tables, which changes whenever the values in either table do
+def getTableVersion(coefficientTable, regionsTable):
+    return hashlib.sha256(json.dumps([coefficientTable, regionsTable], sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+#Cross-correlation coefficients and regression regions read from the tables in coefficient_table.py and hydrologic_region_table.py
+#coefficient_store.CoefficientStore has the same attributes and lookups, read from a memory-mapped store file
+class CoefficientIndex:
+
+    def __init__(self, coefficientTable, regionsTable):
+        #Maps each regression region code to the hydrologic region that contains it, ex. "GC1829" -> "East-Central Plains hydrologic region"
+        self.regressionRegions = {
+            regressionRegionCode: hydrologicRegion
+            for hydrologicRegion, regressionRegionCodes in regionsTable.items()
+            for regressionRegionCode in regressionRegionCodes
+        }
+        self.coefficients = buildCoefficientIndex(coefficientTable, regionsTable)
+        self.version = getTableVersion(coefficientTable, regionsTable)
+        #Every AEP in the tables, in table order, ex. ["Q66.7", "Q50", ..., "Q0.2"]
+        self.AEPs = []
+        for coefficients in coefficientTable.values():
+            for pairCoefficients in coefficients.values():
+                self.AEPs += [AEP for AEP in pairCoefficients if AEP not in self.AEPs]
+
+    #Returns the coefficient, or None if the tables do not have one
+    def getCoefficient(self, regressionRegionCode, methodCode1, methodCode2, AEP):
+        return self.coefficients.get((regressionRegionCode, methodCode1, methodCode2, AEP))
+
+#The current coefficient tables; new tables are swapped in by replacing this reference, never by changing the tables in place
+#Each weighting call reads it once and uses those tables for the whole call, so calls in progress during a swap finish with the old tables
+coefficientTables = None
+
+#Returns the current coefficient tables, loading them on first use from the store file in settings.COEFFICIENT_STORE_PATH, or else from the table modules
+def getCoefficientTables():
+    global coefficientTables
+    if coefficientTables is None:
+        if settings.COEFFICIENT_STORE_PATH:
+            from coefficient_store import CoefficientStore
+            coefficientTables = CoefficientStore(settings.COEFFICIENT_STORE_PATH)
+        else:
+            from coefficient_table import crossCorrelationCoefficientTable
+            from hydrologic_region_table import hydrologicRegionsTable
+            coefficientTables = CoefficientIndex(crossCorrelationCoefficientTable, hydrologicRegionsTable)
+    return coefficientTables
+
+#Swaps in new coefficient tables, ex. a CoefficientIndex built from updated tables or a coefficient_store.CoefficientStore
+def setCoefficientTables(tables):
+    global coefficientTables
+    coefficientTables = tables
+    #The correlation caches are keyed by the tables they were read from, so clearing them only frees the entries of the old tables
+    getCorrelationMatrix.cache_clear()
+    getCorrelationTerms.cache_clear()
+    getWeightTable.cache_clear()
+
+#Key of the store file that was last loaded or tried, so that each replaced file is only loaded once even if it cannot be loaded
+storeFileKey = None
+
+#Loads the store file in settings.COEFFICIENT_STORE_PATH again if it has been replaced since it was loaded, and swaps it in if its table version changed
+#Returns True if new tables were swapped in; the current tables are kept if the file is missing or cannot be loaded
+def reloadCoefficientTables():
+    global storeFileKey
+    if not settings.COEFFICIENT_STORE_PATH:
+        return False
+    from coefficient_store import CoefficientStore, getFileKey
+
+    currentTables = getCoefficientTables()
+    if storeFileKey is None:
+        storeFileKey = getattr(currentTables, "fileKey", None)
+    try:
+        fileKey = getFileKey(settings.COEFFICIENT_STORE_PATH)
+    except FileNotFoundError:
+        return False
+    if fileKey == storeFileKey:
+        return False
+    storeFileKey = fileKey
+
+    newTables = CoefficientStore(settings.COEFFICIENT_STORE_PATH)
+    if newTables.version == currentTables.version:
+        return False
+    setCoefficientTables(newTables)
+    return True
+
+#Parses a statistic code into its method code and AEP, ex. "ACPK0_2AEP" -> ("AC", "Q0.2") and "PK42_9AEP" -> ("BC", "Q42.9")
+#AEP is None if the code does not contain any digits
+@lru_cache(maxsize=1024)
+def parseStatisticCode(code):
+    #Determine method: "BC" (basin characteristic), "AC" (active channel), "BW" (bankfull width), or "RS" (remote sensing)
+    methodCode = code[:2]
+    if methodCode == "PK":
+        methodCode = "BC"
 
-#Returns cross-correlation coefficients between residuals for combinations of different estimation methods
-#Values come from Table 6 https://pubs.usgs.gov/sir/2020/5142/sir20205142.pdf
-def getCrossCorrelationCoefficient(regressionRegionCode, code1, code2):
-    #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
-    #code1, code2 ares the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
+    #Determine AEP: a string to describe the peak-flow discharge with annual exceedance probability, ex. "Q42.9"
+    AEPDigits = re.search(r"\d(.*\d)?", code)
+    if AEPDigits is None:
+        return methodCode, None
+    return methodCode, "Q" + AEPDigits.group(0).replace("_", ".")
 
+#Returns the error type of the first check that two statistic codes fail to be weighted together in a regression region, or None if they can be
+def getCodePairError(regressionRegionCode, code1, code2, coefficientTables):
     if code1 == code2:
-        raise ValueError("codes must all be unique.")
-
-    #Determine hydrologic region that contains this Regression Region
-    hydrologicRegionName = None
-    for hydrologicRegion, regressionRegionCodes in hydrologicRegionsTable.items():
-        if regressionRegionCode in regressionRegionCodes:
-            hydrologicRegionName = hydrologicRegion
-    if hydrologicRegionName == None:
-        raise ValueError("regressionRegionCode not valid.")
-
-    #Determine method for each code: "BC" (basin characteristic), "AC" (active channel), "BW" (bankfull width), or "RS" (remote sensing)
-    methodCode1 = code1[:2]
-    methodCode2 = code2[:2]
-    if methodCode1 == "PK":
-        methodCode1 = "BC"
-    if methodCode2 == "PK":
-        methodCode2 = "BC"
-    validMethodCodes = ["BC", "AC", "BW", "RS"]
+        return DuplicateCodeError
+
+    if regressionRegionCode not in coefficientTables.regressionRegions:
+        return InvalidRegionError
+
+    methodCode1, AEP1 = parseStatisticCode(code1)
+    methodCode2, AEP2 = parseStatisticCode(code2)
     if methodCode1 not in validMethodCodes or methodCode2 not in validMethodCodes:
-        raise ValueError("Method in code not valid.")
+        return InvalidMethodCodeError
     if methodCode1 == methodCode2:
-        raise ValueError("Method in codes must all be unique.")
+        return DuplicateMethodError
 
-    #Determine AEP: a string to describe the peak-flow discharge with annual exceedance probability, ex. "Q42.9"
-    isDigitsCode1 = [x.isdigit() for x in code1]
-    firstDigitIndexCode1 = isDigitsCode1.index(True)
-    lastDigitIndexCode1 = len(isDigitsCode1) - isDigitsCode1[::-1].index(True) - 1
-    
-    isDigitsCode2 = [x.isdigit() for x in code2]
-    firstDigitIndexCode2 = isDigitsCode2.index(True)
-    lastDigitIndexCode2 = len(isDigitsCode2) - isDigitsCode2[::-1].index(True) - 1
-
-    if code1[firstDigitIndexCode1:lastDigitIndexCode1+1] == code2[firstDigitIndexCode2:lastDigitIndexCode2+1]:
-        AEP = "Q" + code1[firstDigitIndexCode1:lastDigitIndexCode1+1].replace("_", ".") 
-    else:
-        raise ValueError("AEP value must be the same for all flow statistics.")
+    if AEP1 is None or AEP2 is None:
+        return InvalidAEPCodeError
+    if AEP1 != AEP2:
+        return MismatchedAEPError
 
-    #Return the coefficient from the table
-    try:
-        coefficient = crossCorrelationCoefficientTable[hydrologicRegionName][methodCode1 + "," + methodCode2][AEP]
-    except:
-        try:
-            coefficient = crossCorrelationCoefficientTable[hydrologicRegionName][methodCode2 + "," + methodCode1][AEP]
-        except:
-            raise Exception("Coefficient could not be determined.")
-    finally: 
-        return coefficient
+    return None
+
+#Checks that two statistic codes can be weighted together in a regression region and returns their method codes and shared AEP
+def checkCodePair(regressionRegionCode, code1, code2, coefficientTables = None):
+    #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
+    #code1, code2 ares the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
+    #coefficientTables are the tables to check the region against; by default the current tables
+
+    errorType = getCodePairError(regressionRegionCode, code1, code2, coefficientTables or getCoefficientTables())
+    if errorType is not None:
+        raise errorType()
+
+    methodCode1, AEP = parseStatisticCode(code1)
+    methodCode2, AEP = parseStatisticCode(code2)
+    return methodCode1, methodCode2, AEP
+
+#Returns cross-correlation coefficients between residuals for combinations of different estimation methods
+#Values come from Table 6 https://pubs.usgs.gov/sir/2020/5142/sir20205142.pdf
+def getCrossCorrelationCoefficient(regressionRegionCode, code1, code2, coefficientTables = None):
+    #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
+    #code1, code2 ares the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
+
+    coefficientTables = coefficientTables or getCoefficientTables()
+    methodCode1, methodCode2, AEP = checkCodePair(regressionRegionCode, code1, code2, coefficientTables)
+
+    #Return the coefficient from the index
+    coefficient = coefficientTables.getCoefficient(regressionRegionCode, methodCode1, methodCode2, AEP)
+    if coefficient is None:
+        raise MissingCoefficientError()
+    return coefficient
+
+#Returns the error type of the first pair of statistic codes, in methodPairIndices order, that fails its checks, or None if all pairs pass
+def getMethodCodesError(regressionRegionCode, codes, coefficientTables):
+    #codes is a list of 2 to 4 statistic codes
+    for (i, j) in methodPairIndices[len(codes)]:
+        errorType = getCodePairError(regressionRegionCode, codes[i], codes[j], coefficientTables)
+        if errorType is not None:
+            return errorType
+    return None
+
+#Checks every pair of statistic codes, in methodPairIndices order, and returns the method codes and shared AEP
+def getMethodCodes(regressionRegionCode, codes, coefficientTables):
+    #codes is a list of 2 to 4 statistic codes
+    errorType = getMethodCodesError(regressionRegionCode, codes, coefficientTables)
+    if errorType is not None:
+        raise errorType()
+    return parseMethodCodes(codes)
+
+#Returns the method codes and the AEP of statistic codes that passed getMethodCodesError
+def parseMethodCodes(codes):
+    parsedCodes = [parseStatisticCode(code) for code in codes]
+    return tuple(methodCode for methodCode, AEP in parsedCodes), parsedCodes[0][1]
+
+#Maximum number of (regressionRegionCode, AEP, coefficientTables) correlation matrices and (regressionRegionCode, AEP, methodCodes, coefficientTables) correlation terms kept in memory
+correlationCacheSize = 256
+correlationTermsCacheSize = 4096
+
+#Pairs of method positions whose correlations are used when weighting 2, 3, or 4 methods: r12, or r12, r13, r23, or r12, r13, r14, r23, r24, r34
+methodPairIndices = {
+    2: ((0, 1),),
+    3: ((0, 1), (0, 2), (1, 2)),
+    4: ((0, 1), (0, 2), (0, 3), (1, 2), (1, 3), (2, 3)),
+}
+
+#Returns the symmetric 4x4 correlation matrix between the residuals of the methods, in validMethodCodes order, for a regression region and AEP
+#The matrix is a tuple of row tuples so that it cannot be changed; coefficients missing from the tables are NaN
+@lru_cache(maxsize=correlationCacheSize)
+def getCorrelationMatrix(regressionRegionCode, AEP, coefficientTables):
+    correlationMatrix = []
+    for i, methodCode1 in enumerate(validMethodCodes):
+        row = []
+        for j, methodCode2 in enumerate(validMethodCodes):
+            if i == j:
+                row.append(1.0)
+                continue
+            coefficient = coefficientTables.getCoefficient(regressionRegionCode, methodCode1, methodCode2, AEP)
+            row.append(math.nan if coefficient is None else coefficient)
+        correlationMatrix.append(tuple(row))
+    return tuple(correlationMatrix)
+
+#Returns the correlations between the residuals of the given methods, in methodPairIndices order, which are all the terms of the weighting equations that do not depend on the SEP values
+#Returns None if a coefficient is missing from the tables, which is cached like any other result; callers report it as a MissingCoefficientError
+@lru_cache(maxsize=correlationTermsCacheSize)
+def getCorrelationTerms(regressionRegionCode, AEP, methodCodes, coefficientTables):
+    #methodCodes is a tuple of 2 to 4 method codes, ex. ("AC", "BC", "RS")
+    correlationMatrix = getCorrelationMatrix(regressionRegionCode, AEP, coefficientTables)
+    methodIndices = [validMethodCodes.index(methodCode) for methodCode in methodCodes]
+    correlationTerms = tuple(correlationMatrix[methodIndices[i]][methodIndices[j]] for (i, j) in methodPairIndices[len(methodCodes)])
+    if any(math.isnan(r) for r in correlationTerms):
+        return None
+    return correlationTerms
+
+#Returns hit and miss statistics for the correlation caches
+def getCorrelationCacheInfo():
+    return {
+        "correlationMatrix": getCorrelationMatrix.cache_info()._asdict(),
+        "correlationTerms": getCorrelationTerms.cache_info()._asdict(),
+    }
+
+#Returns the error type of the first estimate or SEP that cannot be weighted, or None if every value is a finite number greater than zero
+#NaN fails every comparison, so checking 0 < value < inf rejects NaN as well as zero, negative, and infinite values
+def getValuesError(values, nonPositiveError):
+    #nonPositiveError is the error type for zero and negative values, NonPositiveEstimateError or NonPositiveSEPError
+    for value in values:
+        if not 0 < value < math.inf:
+            if -math.inf < value <= 0:
+                return nonPositiveError
+            return NonFiniteValueError
+    return None
+
+#Warning added to results outside the range of the input estimates
+outsideRangeWarning = "Weighted value is outside the range of input values. "
+
+#Warning added to the results of 4 methods when the method with the highest SEP is left out
+droppedMethodWarning = "Only 3 estimation methods can be weighted; the 3 estimation methods with lowest SEP values were weighted. "
 
 #Check if the weighted estimate is within the bounds of input values
-def getWeightingErrorMessage(Z, x1, x2, x3 = None):
+def getWeightingErrorMessage(Z, x1, x2, x3 = None, x4 = None):
     #Z is weighted estimate in log units
-    #x1, x2, x3 are input estimates in log units
+    #x1, x2, x3, x4 are input estimates in log units
     if x3 == None:
         x3 = x1
-    if ((Z < min(x1, x2, x3)) | (Z > max(x1, x2, x3))):
-        return "Weighted value is outside the range of input values. "
+    if x4 == None:
+        x4 = x1
+    if ((Z < min(x1, x2, x3, x4)) | (Z > max(x1, x2, x3, x4))):
+        return outsideRangeWarning
     else:
         return None
 
-def weightEst2(x1, x2, SEP1, SEP2, regressionRegionCode, code1, code2):
-    #x1, x2 are input estimates
-	#SEP1, SEP2 are input SEPs in log units
-	#regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
-    #code1, code2 are the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
-    
-    x1 = math.log10(x1)
-    x2 = math.log10(x2)
-
-    r12 = getCrossCorrelationCoefficient(regressionRegionCode, code1, code2)
-
-    if((SEP1 <= 0) | (SEP2 <= 0)):
-        raise ValueError("All SEP values must be greater than zero.")
-
-    S12 = r12*(SEP1*SEP2) 
+#Builds the covariance matrix of the residuals of N estimation methods: S_ii = SEP_i**2 and S_ij = r_ij*SEP_i*SEP_j
+def getCovarianceMatrix(SEPValues, correlationTerms):
+    #SEPValues is a list of N SEP values in log units
+    #correlationTerms are the correlations for each pair of methods, in methodPairIndices order
+    covarianceMatrix = [[0.0] * len(SEPValues) for i in range(len(SEPValues))]
+    for i, SEP in enumerate(SEPValues):
+        covarianceMatrix[i][i] = SEP**2
+    for (i, j), r in zip(methodPairIndices[len(SEPValues)], correlationTerms):
+        covarianceMatrix[i][j] = covarianceMatrix[j][i] = r*(SEPValues[i]*SEPValues[j])
+    return covarianceMatrix
+
+#Solves for the weights of N estimation methods that minimize the variance of the weighted estimate, which generalizes EQ 5-12 to any number of methods
+#The weights are a = inv(S)*1 / (1'*inv(S)*1) and the SEP of the weighted estimate is (1 / (1'*inv(S)*1))**0.5, found with one Cholesky factorization S = L*L'
+def solveWeights(covarianceMatrix):
+    #covarianceMatrix is an N x N list of lists
+    numberMethods = len(covarianceMatrix)
+
+    #Factor S = L*L' one row at a time, solving L*y = 1 along the way
+    L = [[0.0] * numberMethods for i in range(numberMethods)]
+    y = [0.0] * numberMethods
+    for i in range(numberMethods):
+        Li = L[i]
+        for j in range(i + 1):
+            Lj = L[j]
+            value = covarianceMatrix[i][j]
+            for k in range(j):
+                value -= Li[k]*Lj[k]
+            if i == j:
+                #NaN fails the comparison too, so a matrix with NaN terms is never factored
+                if not value > 0:
+                    raise NotPositiveDefiniteError()
+                Li[i] = value**0.5
+            else:
+                Li[j] = value / Lj[j]
+        value = 1.0
+        for k in range(i):
+            value -= Li[k]*y[k]
+        y[i] = value / Li[i]
+
+    #Solve L'*u = y, so that u = inv(S)*1
+    u = [0.0] * numberMethods
+    for i in range(numberMethods - 1, -1, -1):
+        value = y[i]
+        for k in range(i + 1, numberMethods):
+            value -= L[k][i]*u[k]
+        u[i] = value / L[i][i]
+
+    precision = sum(u)
+    weights = [value / precision for value in u] #EQ 6-8
+    SEPZ = (1 / precision)**0.5 #EQ 10, 12
+    return weights, SEPZ
+
+#Batched form of solveWeights for a stack of covariance matrices
+def solveWeightsBatch(covarianceMatrices):
+    #covarianceMatrices is a NumPy array with shape (M, N, N)
+    #Returns weights with shape (M, N) and SEPZ with shape (M,); rows whose covariance matrix is not positive definite are NaN
+    import numpy as np
+
+    validMatrices = np.ones(covarianceMatrices.shape[0], dtype=bool)
+    try:
+        L = np.linalg.cholesky(covarianceMatrices)
+    except np.linalg.LinAlgError:
+        validMatrices = np.linalg.eigvalsh(covarianceMatrices).min(axis=-1) > 0
+        covarianceMatrices = np.where(validMatrices[:, None, None], covarianceMatrices, np.eye(covarianceMatrices.shape[-1]))
+        L = np.linalg.cholesky(covarianceMatrices)
+
+    ones = np.ones(covarianceMatrices.shape[:-1] + (1,))
+    y = np.linalg.solve(L, ones)
+    u = np.linalg.solve(np.swapaxes(L, -1, -2), y)[..., 0]
+
+    precision = u.sum(axis=-1)
+    weights = u / precision[:, None] #EQ 6-8
+    SEPZ = np.sqrt(1 / precision) #EQ 10, 12
+    weights[~validMatrices] = np.nan
+    SEPZ[~validMatrices] = np.nan
+    return weights, SEPZ
+
+#Weights and SEPZ can be precomputed for the combinations of SEP values that come up again and again, since SEPs come from a small set of published regression equations per region and AEP
+#The known combinations are read from settings.WEIGHT_TABLE_PATH (see weight_table.py) or set with setSEPCombinations, and other combinations are solved when they are weighted
+precomputeWeights = bool(settings.WEIGHT_TABLE_PATH)
+
+#(regressionRegionCode, codes, SEP values) tuples of the known combinations, ex. ("GC1832", ("ACPK66_7AE", "PK66_7AEP"), (0.483, 0.376))
+SEPCombinations = None
+
+def getSEPCombinations():
+    global SEPCombinations
+    if SEPCombinations is None:
+        SEPCombinations = []
+        if settings.WEIGHT_TABLE_PATH:
+            from weight_table import readSEPCombinations
+            SEPCombinations = readSEPCombinations(settings.WEIGHT_TABLE_PATH)
+    return SEPCombinations
+
+#Replaces the known combinations; an empty list turns precomputation off
+def setSEPCombinations(combinations):
+    global SEPCombinations, precomputeWeights
+    SEPCombinations = list(combinations)
+    precomputeWeights = bool(SEPCombinations)
+    getWeightTable.cache_clear()
+
+#Returns a dict of (regressionRegionCode, codes, SEP values) -> (weights, SEPZ) for every known combination that can be weighted with the coefficient tables
+#The table is built the first time it is needed for each coefficient tables, so tables that are swapped in get their own table
+@lru_cache(maxsize=2)
+def getWeightTable(coefficientTables):
+    weightTable = {}
+    for regressionRegionCode, codes, SEPValues in getSEPCombinations():
+        #A combination of 4 methods is also tabulated without its highest SEP method, which is what weightEst4 weights by default
+        combinations = [(codes, SEPValues)]
+        if len(codes) == 4:
+            maxSEPIndex = SEPValues.index(max(SEPValues))
+            combinations.append((codes[:maxSEPIndex] + codes[maxSEPIndex + 1:], SEPValues[:maxSEPIndex] + SEPValues[maxSEPIndex + 1:]))
+        for codes, SEPValues in combinations:
+            #Combinations that cannot be weighted are left out, so that they raise their error when they are weighted
+            try:
+                methodCodes, AEP = getMethodCodes(regressionRegionCode, codes, coefficientTables)
+                correlationTerms = getCorrelationTerms(regressionRegionCode, AEP, methodCodes, coefficientTables)
+                if correlationTerms is None or getValuesError(SEPValues, NonPositiveSEPError) is not None:
+                    continue
+                weights, SEPZ = solveWeights(getCovarianceMatrix(SEPValues, correlationTerms))
+            except Exception:
+                continue
+            weightTable[(regressionRegionCode, codes, SEPValues)] = (tuple(weights), SEPZ)
+    return weightTable
+
+#Weights N estimation methods with the covariance matrix built from their SEPs and the table correlations
+#weightEst2, weightEst3, and weightEst4 are wrappers around this function
+def weightEstN(xValues, SEPValues, regressionRegionCode, codeValues, coefficientTables = None):
+    #xValues is a list of 2 to 4 input estimates
+    #SEPValues is a list of the input SEPs in log units
+    #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
+    #codeValues is a list of the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
+    #coefficientTables are the tables to weight with; by default the current tables
+
+    errorType = getValuesError(xValues, NonPositiveEstimateError)
+    if errorType is not None:
+        raise errorType()
+    xValues = [math.log10(x) for x in xValues]
+
+    if metrics.enabled:
+        lookupStart = perf_counter()
+
+    coefficientTables = coefficientTables or getCoefficientTables()
+    #Combinations in the weight table were checked and solved when it was built, which leaves only the weighted sum
+    precomputed = None
+    if precomputeWeights:
+        precomputed = getWeightTable(coefficientTables).get((regressionRegionCode, tuple(codeValues), tuple(SEPValues)))
+    if precomputed is None:
+        methodCodes, AEP = getMethodCodes(regressionRegionCode, codeValues, coefficientTables)
+        correlationTerms = getCorrelationTerms(regressionRegionCode, AEP, methodCodes, coefficientTables)
+        if correlationTerms is None:
+            raise MissingCoefficientError()
+
+    if metrics.enabled:
+        mathStart = perf_counter()
+        metrics.observeStage("lookup", mathStart - lookupStart)
+
+    if precomputed is None:
+        errorType = getValuesError(SEPValues, NonPositiveSEPError)
+        if errorType is not None:
+            raise errorType()
+        weights, SEPZ = solveWeights(getCovarianceMatrix(SEPValues, correlationTerms))
+    else:
+        weights, SEPZ = precomputed
 
-    a1 = (SEP2**2 - S12) / (SEP1**2 + SEP2**2 - 2*S12)
-    a2 = 1-a1
+    Z = sum(a*x for (a, x) in zip(weights, xValues)) #EQ 5, 11
+    warningMessage = getWeightingErrorMessage(Z, *xValues)
 
-    Z = a1*x1 + a2*x2 #EQ 11
-    SEPZ = ((SEP1**2*SEP2**2 - S12**2) / (SEP1**2 + SEP2**2 - 2*S12))**0.5 #EQ 12
+    if metrics.enabled:
+        metrics.observeStage("math", perf_counter() - mathStart)
+        if warningMessage is not None:
+            metrics.countOutsideRange()
 
-    warningMessage = getWeightingErrorMessage(Z, x1, x2)
-    
     CI = 1.64 * SEPZ #Confidence interval
-    PIL = 10 ** (Z - CI) #Prediction Interval-Lower 
-    PIU = 10 ** (Z + CI) #Prediction Interval-Upper
-    Z = 10 ** Z #delog the Z value
+    try:
+        PIL = 10 ** (Z - CI) #Prediction Interval-Lower 
+        PIU = 10 ** (Z + CI) #Prediction Interval-Upper
+        Z = 10 ** Z #delog the Z value
+    except OverflowError:
+        raise NonFiniteResultError() from None
 
     return((Z, SEPZ, CI, PIL, PIU, warningMessage)) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
 
-def weightEst3(x1, x2, x3, SEP1, SEP2, SEP3, regressionRegionCode, code1, code2, code3):
+def weightEst2(x1, x2, SEP1, SEP2, regressionRegionCode, code1, code2, coefficientTables = None):
+    #x1, x2 are input estimates
+	#SEP1, SEP2 are input SEPs in log units
+	#regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
+    #code1, code2 are the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
+
+    return weightEstN([x1, x2], [SEP1, SEP2], regressionRegionCode, [code1, code2], coefficientTables) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
+
+def weightEst3(x1, x2, x3, SEP1, SEP2, SEP3, regressionRegionCode, code1, code2, code3, coefficientTables = None):
     #x1, x2, x3 are input estimates
 	#SEP1, SEP2, SEP3 are input SEPs in log units
     #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
     #code1, code2, code3 are the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
 
-    x1 = math.log10(x1)
-    x2 = math.log10(x2)
-    x3 = math.log10(x3)
-
-    r12 = getCrossCorrelationCoefficient(regressionRegionCode, code1, code2)
-    r13 = getCrossCorrelationCoefficient(regressionRegionCode, code1, code3)
-    r23 = getCrossCorrelationCoefficient(regressionRegionCode, code2, code3)
-
-    if((SEP1 <= 0) | (SEP2 <= 0) | (SEP3 <= 0)):
-        raise ValueError("All SEP values must be greater than zero.")
-
-    S12 = r12*(SEP1*SEP2) 
-    S13 = r13*(SEP1*SEP3)
-    S23 = r23*(SEP2*SEP3)
-
-    A = SEP1**2 + SEP3**2 - 2*S13
-    B = SEP3**2 + S12 - S13 - S23
-    C = SEP2**2 + SEP3**2 - 2*S23
-
-    a1 = (C*(SEP3**2 - S13) - B*(SEP3**2 - S23)) / (A*C - B**2) #EQ 6
-    a2 = (A*(SEP3**2 - S23) - B*(SEP3**2 - S13)) / (A*C - B**2) #EQ 7
-    a3 = 1 - a1 - a2 #EQ 8
-
-    Z = a1*x1 + a2*x2 + a3*x3 #EQ 5
-
-    SEPZ = ((a1*SEP1)**2 + (a2*SEP2)**2 + (a3*SEP3)**2 + 2*a1*a2*S12 + 2*a1*a3*S13 + 2*a2*a3*S23)**0.5 #EQ 10
-    warningMessage = getWeightingErrorMessage(Z, x1, x2, x3)
-
-    CI = 1.64 * SEPZ #Confidence interval
-    PIL = 10 ** (Z - CI) #Prediction Interval-Lower 
-    PIU = 10 ** (Z + CI) #Prediction Interval-Upper
-    Z = 10 ** Z #delog the Z value
-
-    return((Z, SEPZ, CI, PIL, PIU, warningMessage)) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
+    return weightEstN([x1, x2, x3], [SEP1, SEP2, SEP3], regressionRegionCode, [code1, code2, code3], coefficientTables) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
 
-def weightEst4(x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4):
+def weightEst4(x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4, useAllMethods = False, coefficientTables = None):
     #x1, x2, x3, x4 are input estimates
 	#SEP1, SEP2, SEP3, SEP4 are input SEPs in log units
     #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
     #code1, code2, code3, code4 are the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
+    #useAllMethods weights all 4 estimation methods; by default the method with the highest SEP is left out
 
     xValues = [x1, x2, x3, x4]
     SEPValues = [SEP1, SEP2, SEP3, SEP4]
     codeValues = [code1, code2, code3, code4]
 
+    if useAllMethods:
+        return weightEstN(xValues, SEPValues, regressionRegionCode, codeValues, coefficientTables) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
+
+    #The lists are weighted as they are once the method is left out, the same as weightEst3 would weight them
     maxSEPIndex = SEPValues.index(max(SEPValues))
 
-    xValues.pop(maxSEPIndex)
-    SEPValues.pop(maxSEPIndex)
-    codeValues.pop(maxSEPIndex)
+    del xValues[maxSEPIndex]
+    del SEPValues[maxSEPIndex]
+    del codeValues[maxSEPIndex]
 
-    Z, SEPZ, CI, PIL, PIU, warningMessage = weightEst3(*xValues, *SEPValues, regressionRegionCode, *codeValues) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
+    Z, SEPZ, CI, PIL, PIU, warningMessage = weightEstN(xValues, SEPValues, regressionRegionCode, codeValues, coefficientTables) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
 
     if warningMessage is None:
         warningMessage = ""
-    warningMessage += "Only 3 estimation methods can be weighted; the 3 estimation methods with lowest SEP values were weighted. "
+    warningMessage += droppedMethodWarning
 
     return(Z, SEPZ, CI, PIL, PIU, warningMessage) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
 
-# This single endpoint will pass the inputs to weightEst2, weightEst3, or weightEst4, depending on the number of valid x values (values > 0)
-def weightEst(x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4):
+#Selects the methods to weight in one pass over the inputs, without raising: the methods that have an x value, leaving out the method with the highest SEP when all 4 do unless useAllMethods
+#Returns lists of the selected x values, SEPs and codes and whether a method was left out, and None; or None and the error type of the first check that fails
+def selectMethods(xValues, SEPValues, codeValues, useAllMethods = False):
+    #xValues, SEPValues, codeValues are sequences of up to four inputs of each kind, with None for unused methods
+
+    xSelected = []
+    SEPSelected = []
+    codeSelected = []
+    missingSEP = missingCode = False
+    for x, SEP, code in zip(xValues, SEPValues, codeValues):
+        if x is None:
+            continue
+        if SEP is None:
+            missingSEP = True
+        if code is None:
+            missingCode = True
+        xSelected.append(x)
+        SEPSelected.append(SEP)
+        codeSelected.append(code)
+
+    # Check that corresponding SEP values are all valid (not null)
+    if missingSEP:
+        return None, MissingSEPError
+    if missingCode:
+        return None, MissingCodeError
+    if len(xSelected) < 2:
+        return None, TooFewMethodsError
+
+    droppedMethod = len(xSelected) == 4 and not useAllMethods
+    if droppedMethod:
+        maxSEPIndex = SEPSelected.index(max(SEPSelected))
+        del xSelected[maxSEPIndex]
+        del SEPSelected[maxSEPIndex]
+        del codeSelected[maxSEPIndex]
+
+    return (xSelected, SEPSelected, codeSelected, droppedMethod), None
+
+# This single endpoint will weight 2 or 3 methods, or the 3 methods with the lowest SEP values as weightEst4 does, depending on the number of valid x values (values > 0)
+def weightEst(x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4, coefficientTables = None):
     #x1, x2, x3, x4 are input estimates
 	#SEP1, SEP2, SEP3, SEP4 are input SEPs in log units
     #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
     #code1, code2, code3, code4 are the string codes that describes the flow statistic for the estimation methods, ex. "ACPK0_2AEP", which represents "Active Channel Width 0.2-percent AEP flood"
 
-    xValues = [x1, x2, x3, x4]
-    SEPValues = [SEP1, SEP2, SEP3, SEP4]
-    codeValues = [code1, code2, code3, code4]
+    selection, errorType = selectMethods((x1, x2, x3, x4), (SEP1, SEP2, SEP3, SEP4), (code1, code2, code3, code4))
+    if errorType is not None:
+        raise errorType()
+    xValues, SEPValues, codeValues, droppedMethod = selection
 
-    validValues = [element != None for element in xValues] # Boolean list to denote which values are valid (corresponding x values greater than 0)
-    numberValidValues = sum(validValues)
+    Z, SEPZ, CI, PIL, PIU, warningMessage = weightEstN(xValues, SEPValues, regressionRegionCode, codeValues, coefficientTables)
 
-    xValidValues = [i for (i, v) in zip(xValues, validValues) if v]
-    SEPValidValues = [i for (i, v) in zip(SEPValues, validValues) if v]
-    codeValidValues = [i for (i, v) in zip(codeValues, validValues) if v]
+    if droppedMethod:
+        if warningMessage is None:
+            warningMessage = ""
+        warningMessage += droppedMethodWarning
 
-    # Check that corresponding SEP values are all valid (not null)
-    if None in SEPValidValues:
-        raise ValueError("SEP values were unavailable for corresponding flow statistic values.")
-    if None in codeValidValues:
-        raise ValueError("Code values were unavailable for corresponding flow statistic values.")
-
-    if (numberValidValues < 2):
-        raise ValueError("At least two estimation method values must be provided.")
-    elif (numberValidValues == 2):
-        return weightEst2(*xValidValues, *SEPValidValues, regressionRegionCode, *codeValidValues)
-    elif (numberValidValues == 3):
-        return weightEst3(*xValidValues, *SEPValidValues, regressionRegionCode, *codeValidValues)
-    elif (numberValidValues == 4):
-         return weightEst4(*xValidValues, *SEPValidValues, regressionRegionCode, *codeValidValues)
\ No newline at end of file
+    return(Z, SEPZ, CI, PIL, PIU, warningMessage) #Returns weighted estimate Z, associated SEP, and warning messages about results validity
+
+#Compact records for weighting one site: weightEstRecord takes a WeightingInput and returns a WeightingResult, with the same checks and results as weightEst
+#Records are slotted, so they hold their values without a dict, and a WeightingInput can be built once and weighted again, ex. with swapped coefficient tables
+class WeightingInput:
+    __slots__ = ("xValues", "SEPValues", "regressionRegionCode", "codeValues")
+
+    def __init__(self, xValues, SEPValues, regressionRegionCode, codeValues):
+        #xValues, SEPValues, codeValues are sequences of up to 4 input estimates, SEPs in log units, and statistic codes, with None for unused methods, ex. (122, 8.24, None, None)
+        #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
+        self.xValues = xValues
+        self.SEPValues = SEPValues
+        self.regressionRegionCode = regressionRegionCode
+        self.codeValues = codeValues
+
+class WeightingResult:
+    __slots__ = ("Z", "SEPZ", "CI", "PIL", "PIU", "warningMessage")
+
+    def __init__(self, Z, SEPZ, CI, PIL, PIU, warningMessage):
+        self.Z = Z
+        self.SEPZ = SEPZ
+        self.CI = CI
+        self.PIL = PIL
+        self.PIU = PIU
+        self.warningMessage = warningMessage
+
+    #Unpacks in the same order as the tuples returned by weightEst
+    def __iter__(self):
+        return iter((self.Z, self.SEPZ, self.CI, self.PIL, self.PIU, self.warningMessage))
+
+def weightEstRecord(record, useAllMethods = False, coefficientTables = None):
+    #record is a WeightingInput
+    #useAllMethods weights all 4 estimation methods; by default the method with the highest SEP is left out, as in weightEst4
+    #coefficientTables are the tables to weight with; by default the current tables
+
+    selection, errorType = selectMethods(record.xValues, record.SEPValues, record.codeValues, useAllMethods)
+    if errorType is not None:
+        raise errorType()
+    xValues, SEPValues, codeValues, droppedMethod = selection
+
+    result = WeightingResult(*weightEstN(xValues, SEPValues, record.regressionRegionCode, codeValues, coefficientTables))
+
+    if droppedMethod:
+        if result.warningMessage is None:
+            result.warningMessage = ""
+        result.warningMessage += droppedMethodWarning
+
+    return result
+
+#Prepares one batch row for vectorized weighting, applying the same checks as weightEst2, weightEst3, and weightEst4, without raising
+#Returns the row values and None, or None and the error type of the first check that fails
+def checkBatchRow(row, coefficientTables):
+    #row is a sequence of the weightEst arguments, in order: x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4
+    #The row values are the log10 x values, SEP values, cross-correlation coefficients in methodPairIndices order, and whether a method was dropped
+
+    selection, errorType = selectMethods(row[0:4], row[4:8], row[9:13])
+    if errorType is not None:
+        return None, errorType
+    xValues, SEPValues, codeValues, droppedMethod = selection
+    regressionRegionCode = row[8]
+
+    errorType = getValuesError(xValues, NonPositiveEstimateError)
+    if errorType is not None:
+        return None, errorType
+    xValues = [math.log10(x) for x in xValues]
+
+    errorType = getMethodCodesError(regressionRegionCode, codeValues, coefficientTables)
+    if errorType is not None:
+        return None, errorType
+    methodCodes, AEP = parseMethodCodes(codeValues)
+    coefficients = getCorrelationTerms(regressionRegionCode, AEP, methodCodes, coefficientTables)
+    if coefficients is None:
+        return None, MissingCoefficientError
+
+    errorType = getValuesError(SEPValues, NonPositiveSEPError)
+    if errorType is not None:
+        return None, errorType
+
+    return (xValues, SEPValues, coefficients, droppedMethod), None
+
+#Raising form of checkBatchRow, which returns the row values of a valid row and raises the error of an invalid one
+def getBatchRowValues(row, coefficientTables):
+    rowValues, errorType = checkBatchRow(row, coefficientTables)
+    if errorType is not None:
+        raise errorType()
+    return rowValues
+
+#Vectorized form of weightEstN for M sites that each weight the same number of methods N
+def weightEstArrays(xArray, SEPArray, correlationTermsArray):
+    #xArray is an (M, N) NumPy array of input estimates in log units
+    #SEPArray is an (M, N) NumPy array of input SEPs in log units
+    #correlationTermsArray is an (M, P) NumPy array of the correlations for each pair of methods, in methodPairIndices order
+    #Returns Z and SEPZ in log units, and whether Z is outside the range of the input values; sites that cannot be weighted are NaN
+    import numpy as np
+
+    numberMethods = xArray.shape[1]
+    correlationMatrices = np.tile(np.eye(numberMethods), (xArray.shape[0], 1, 1))
+    for position, (i, j) in enumerate(methodPairIndices[numberMethods]):
+        correlationMatrices[:, i, j] = correlationMatrices[:, j, i] = correlationTermsArray[:, position]
+    covarianceMatrices = correlationMatrices * SEPArray[:, :, None] * SEPArray[:, None, :]
+
+    weights, SEPZ = solveWeightsBatch(covarianceMatrices)
+
+    Z = (weights * xArray).sum(axis=1) #EQ 5, 11
+    outsideRange = (Z < xArray.min(axis=1)) | (Z > xArray.max(axis=1))
+
+    return Z, SEPZ, outsideRange
+
+#Weights rows prepared with getBatchRowValues, one vectorized pass for each number of methods, and stores each row's result in results at its index
+def weightBatchGroups(groups, results):
+    #groups is a dict of number of estimation methods -> list of (index, xValues, SEPValues, coefficients, droppedMethod) from getBatchRowValues
+    #results is a list the (Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId) tuples are stored in; rows whose covariance matrix is not positive definite get an errorMessage and errorId
+    import numpy as np
+
+    for numberMethods, groupRows in groups.items():
+        if not groupRows:
+            continue
+
+        xArray = np.array([groupRow[1] for groupRow in groupRows], dtype=float)
+        SEPArray = np.array([groupRow[2] for groupRow in groupRows], dtype=float)
+        coefficientArray = np.array([groupRow[3] for groupRow in groupRows], dtype=float)
+
+        #Rows that overflow are flagged by their results below, so NumPy's warnings are not needed
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            Z, SEPZ, outsideRange = weightEstArrays(xArray, SEPArray, coefficientArray)
+
+            CI = 1.64 * SEPZ #Confidence interval
+            PIL = 10 ** (Z - CI) #Prediction Interval-Lower
+            PIU = 10 ** (Z + CI) #Prediction Interval-Upper
+            Z = 10 ** Z #delog the Z value
+        #PIU is the largest result, so it overflows whenever any of them does
+        finite = np.isfinite(PIU)
+
+        if metrics.enabled:
+            metrics.countOutsideRange(int(outsideRange.sum()))
+
+        #The arrays are converted to lists of floats once instead of indexing NumPy scalars for every row
+        for groupRow, Zi, SEPZi, CIi, PILi, PIUi, outside, finitei in zip(groupRows, Z.tolist(), SEPZ.tolist(), CI.tolist(), PIL.tolist(), PIU.tolist(), outsideRange.tolist(), finite.tolist()):
+            if math.isnan(SEPZi):
+                results[groupRow[0]] = (None, None, None, None, None, None, NotPositiveDefiniteError.message, NotPositiveDefiniteError.errorId)
+                if metrics.enabled:
+                    metrics.countError(NotPositiveDefiniteError)
+                continue
+            if not finitei:
+                results[groupRow[0]] = (None, None, None, None, None, None, NonFiniteResultError.message, NonFiniteResultError.errorId)
+                if metrics.enabled:
+                    metrics.countError(NonFiniteResultError)
+                continue
+            warningMessage = None
+            if outside:
+                warningMessage = outsideRangeWarning
+            if groupRow[4]:
+                if warningMessage is None:
+                    warningMessage = ""
+                warningMessage += droppedMethodWarning
+            results[groupRow[0]] = (Zi, SEPZi, CIi, PILi, PIUi, warningMessage, None, None)
+
+# Weights many sites at once: each row is validated on its own, then all rows with the same number of methods are weighted in one vectorized pass
+def weightEstBatch(rows, coefficientTables = None):
+    #rows is a list of sequences of the weightEst arguments, in order: x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4
+    #coefficientTables are the tables to weight with; by default the current tables
+    #Returns a list, in the same order as rows, of (Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId) tuples; rows that could not be weighted have None results, an errorMessage, and the errorId of their error type (see weighting_errors.py)
+
+    coefficientTables = coefficientTables or getCoefficientTables()
+    results = [None] * len(rows)
+    groups = {2: [], 3: []} # Rows to weight, keyed by the number of estimation methods
+
+    if metrics.enabled:
+        lookupStart = perf_counter()
+
+    for index, row in enumerate(rows):
+        #Invalid rows are reported by their error type, without raising; anything else a row raises, ex. a TypeError for a value that is not a number, fails only that row
+        try:
+            rowValues, errorType = checkBatchRow(row, coefficientTables)
+        except Exception as e:
+            results[index] = (None, None, None, None, None, None, str(e), getattr(e, "errorId", WeightingError.errorId))
+            if metrics.enabled:
+                metrics.countError(e)
+            continue
+        if errorType is not None:
+            results[index] = (None, None, None, None, None, None, errorType.message, errorType.errorId)
+            if metrics.enabled:
+                metrics.countError(errorType)
+            continue
+        groups[len(rowValues[0])].append((index,) + rowValues)
+
+    if metrics.enabled:
+        mathStart = perf_counter()
+        metrics.observeStage("lookup", mathStart - lookupStart)
+
+    weightBatchGroups(groups, results)
+
+    if metrics.enabled:
+        metrics.observeStage("math", perf_counter() - mathStart)
+
+    return results
+
+#Weights the estimates of one site for every AEP in the coefficient tables, the whole frequency curve, in one vectorized pass
+def weightEstCurve(methodCodes, xValues, SEPValues, regressionRegionCode, useAllMethods = False, coefficientTables = None):
+    #methodCodes is a list of 2 to 4 method codes, ex. ["AC", "BC", "RS"]; "PK" is the same as "BC"
+    #xValues, SEPValues are lists with one list per method of its input estimates and its SEPs in log units, with one value for each AEP in coefficientTables.AEPs order (Q66.7 through Q0.2)
+    #regressionRegionCode is the string code for the Regression Region, ex. "GC1829"
+    #useAllMethods weights all 4 estimation methods; by default the method with the highest SEP is left out at each AEP, as in weightEst4
+    #Returns a list, in AEP order, of (AEP, Z, SEPZ, CI, PIL, PIU, warningMessage) tuples
+    import numpy as np
+
+    coefficientTables = coefficientTables or getCoefficientTables()
+    AEPs = coefficientTables.AEPs
+    methodCodes = ["BC" if methodCode == "PK" else methodCode for methodCode in methodCodes]
+
+    if len(methodCodes) < 2:
+        raise TooFewMethodsError()
+    if regressionRegionCode not in coefficientTables.regressionRegions:
+        raise InvalidRegionError()
+    if any(methodCode not in validMethodCodes for methodCode in methodCodes):
+        raise InvalidMethodCodeError()
+    if len(set(methodCodes)) != len(methodCodes):
+        raise DuplicateMethodError()
+    if len(xValues) != len(methodCodes) or len(SEPValues) != len(methodCodes) or any(len(values) != len(AEPs) for values in list(xValues) + list(SEPValues)):
+        raise MismatchedLengthError("Estimates and SEP values must be provided for every method at each AEP: " + ", ".join(AEPs) + ".")
+
+    if metrics.enabled:
+        lookupStart = perf_counter()
+
+    xArray = np.array(xValues, dtype=float).T # (AEPs, methods)
+    SEPArray = np.array(SEPValues, dtype=float).T
+    if not (np.isfinite(xArray).all() and np.isfinite(SEPArray).all()):
+        raise NonFiniteValueError()
+    if (xArray <= 0).any():
+        raise NonPositiveEstimateError()
+    if (SEPArray <= 0).any():
+        raise NonPositiveSEPError()
+    xArray = np.log10(xArray)
+
+    #Leave out the method with the highest SEP at each AEP, keeping the other methods in order
+    droppedMethod = len(methodCodes) == 4 and not useAllMethods
+    if droppedMethod:
+        keptMethods = np.ones(xArray.shape, dtype=bool)
+        keptMethods[np.arange(len(AEPs)), SEPArray.argmax(axis=1)] = False
+        xArray = xArray[keptMethods].reshape(len(AEPs), 3)
+        SEPArray = SEPArray[keptMethods].reshape(len(AEPs), 3)
+        AEPMethodCodes = [tuple(methodCode for methodCode, kept in zip(methodCodes, keptRow) if kept) for keptRow in keptMethods]
+    else:
+        AEPMethodCodes = [tuple(methodCodes)] * len(AEPs)
+
+    correlationTerms = [getCorrelationTerms(regressionRegionCode, AEP, AEPMethodCodes[i], coefficientTables) for i, AEP in enumerate(AEPs)]
+    if None in correlationTerms:
+        raise MissingCoefficientError()
+    correlationTermsArray = np.array(correlationTerms, dtype=float)
+
+    if metrics.enabled:
+        mathStart = perf_counter()
+        metrics.observeStage("lookup", mathStart - lookupStart)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        Z, SEPZ, outsideRange = weightEstArrays(xArray, SEPArray, correlationTermsArray)
+    if np.isnan(SEPZ).any():
+        raise NotPositiveDefiniteError()
+
+    CI = 1.64 * SEPZ #Confidence interval
+    with np.errstate(over='ignore'):
+        PIL = 10 ** (Z - CI) #Prediction Interval-Lower
+        PIU = 10 ** (Z + CI) #Prediction Interval-Upper
+        Z = 10 ** Z #delog the Z value
+    if not np.isfinite(PIU).all():
+        raise NonFiniteResultError()
+
+    results = []
+    for i, AEP in enumerate(AEPs):
+        warningMessage = None
+        if outsideRange[i]:
+            warningMessage = outsideRangeWarning
+        if droppedMethod:
+            if warningMessage is None:
+                warningMessage = ""
+            warningMessage += droppedMethodWarning
+        results.append((AEP, float(Z[i]), float(SEPZ[i]), float(CI[i]), float(PIL[i]), float(PIU[i]), warningMessage))
+
+    if metrics.enabled:
+        metrics.observeStage("math", perf_counter() - mathStart)
+        metrics.countOutsideRange(int(outsideRange.sum()))
+
+    return results
+
+#Quantiles returned by weightEstSensitivity by default
+defaultSensitivityQuantiles = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+#Monte Carlo sensitivity of the weighted estimate of one site to perturbations of its input estimates and SEPs
+#Each sample perturbs every log10 estimate by a normal error with standard deviation xSigma and multiplies every SEP by 10 to the power of a normal error with standard deviation SEPSigma,
+#then all samples are weighted in one vectorized pass with the correlations of the site's methods
+def weightEstSensitivity(xValues, SEPValues, regressionRegionCode, codeValues, xSigmas = 0, SEPSigmas = 0, numberSamples = 10000, quantiles = defaultSensitivityQuantiles, useAllMethods = False, seed = None, coefficientTables = None):
+    #xValues, SEPValues, codeValues are lists of up to 4 input estimates, SEPs in log units, and statistic codes, with None for unused methods, as in weightEst
+    #xSigmas, SEPSigmas are the standard deviations of the perturbations in log units, either one value for every method or a list in the same order as xValues; None or 0 leaves a value unperturbed
+    #numberSamples is the number of Monte Carlo samples, at most settings.SENSITIVITY_MAX_SAMPLES
+    #quantiles are the quantiles of the sampled results to return, each from 0 to 1
+    #useAllMethods weights all 4 estimation methods; by default the method with the highest SEP is left out, as in weightEst4
+    #seed makes the samples repeatable
+    #Returns the unperturbed (Z, SEPZ, CI, PIL, PIU, warningMessage), and a dict of "Z", "SEPZ", "PIL", and "PIU" -> (mean, list of the values at each quantile) over the samples
+    import numpy as np
+
+    if not 1 <= numberSamples <= settings.SENSITIVITY_MAX_SAMPLES:
+        raise InvalidParameterError("Number of samples must be from 1 to " + str(settings.SENSITIVITY_MAX_SAMPLES) + ".")
+    if any(not 0 <= quantile <= 1 for quantile in quantiles):
+        raise InvalidParameterError("Quantiles must be from 0 to 1.")
+    if seed is not None and seed < 0:
+        raise InvalidParameterError("Seed must not be negative.")
+
+    coefficientTables = coefficientTables or getCoefficientTables()
+    numberValues = len(xValues)
+    xSigmas = xSigmas if isinstance(xSigmas, (list, tuple)) else [xSigmas] * numberValues
+    SEPSigmas = SEPSigmas if isinstance(SEPSigmas, (list, tuple)) else [SEPSigmas] * numberValues
+    if len(xSigmas) != numberValues or len(SEPSigmas) != numberValues:
+        raise InvalidParameterError("A perturbation must be given for every estimation method.")
+    if any(sigma is not None and not 0 <= sigma < math.inf for sigma in list(xSigmas) + list(SEPSigmas)):
+        raise InvalidParameterError("Perturbations must be finite and not negative.")
+
+    #Select the methods with selectMethods, as weightEst does, keeping the perturbations of each method with it
+    #  selectMethods only checks the x values for None and carries them along, so selecting the indices of the methods in their place gives the indices of the selected methods
+    selection, errorType = selectMethods([None if x is None else index for index, x in enumerate(xValues)], SEPValues, codeValues, useAllMethods)
+    if errorType is not None:
+        raise errorType()
+    methodIndices, SEPValues, codeValues, droppedMethod = selection
+    xValues = [xValues[index] for index in methodIndices]
+    xSigmas = [xSigmas[index] or 0.0 for index in methodIndices]
+    SEPSigmas = [SEPSigmas[index] or 0.0 for index in methodIndices]
+
+    #The unperturbed result also checks the inputs
+    result = weightEstN(xValues, SEPValues, regressionRegionCode, codeValues, coefficientTables)
+    if droppedMethod:
+        result = result[:5] + ((result[5] or "") + droppedMethodWarning,)
+    methodCodes, AEP = getMethodCodes(regressionRegionCode, codeValues, coefficientTables)
+    correlationTerms = getCorrelationTerms(regressionRegionCode, AEP, methodCodes, coefficientTables)
+
+    if metrics.enabled:
+        mathStart = perf_counter()
+
+    generator = np.random.default_rng(seed)
+    numberMethods = len(xValues)
+    correlationTermsArray = np.broadcast_to(np.array(correlationTerms), (numberSamples, len(correlationTerms)))
+
+    #Samples of large perturbations can overflow or leave SEPs of 0; they are flagged by their results below, so NumPy's warnings are not needed
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        xArray = np.log10(xValues) + generator.standard_normal((numberSamples, numberMethods)) * xSigmas
+        SEPArray = SEPValues * 10 ** (generator.standard_normal((numberSamples, numberMethods)) * SEPSigmas)
+        #Covariances are products of two SEPs, so the squares of the SEPs must be finite as well
+        if not (np.isfinite(xArray).all() and np.isfinite(SEPArray ** 2).all()):
+            raise NonFiniteResultError()
+
+        Z, SEPZ, outsideRange = weightEstArrays(xArray, SEPArray, correlationTermsArray)
+        CI = 1.64 * SEPZ #Confidence interval
+        sampledResults = {
+            "Z": 10 ** Z, #delog the Z value
+            "SEPZ": SEPZ,
+            "PIL": 10 ** (Z - CI), #Prediction Interval-Lower
+            "PIU": 10 ** (Z + CI), #Prediction Interval-Upper
+        }
+    if not all(np.isfinite(values).all() for values in sampledResults.values()):
+        raise NonFiniteResultError()
+    summaries = {
+        name: (float(values.mean()), np.quantile(values, quantiles).tolist())
+        for name, values in sampledResults.items()
+    }
+
+    if metrics.enabled:
+        metrics.observeStage("math", perf_counter() - mathStart)
+
+    return result, summaries
@@ -0,0 +1,54 @@
+# Memory allocated by one call of the single-site weighting functions in ChannelWidthWeighting.py, measured with tracemalloc
+#  tracemalloc only keeps the blocks that are still allocated, so temporaries are measured by the peak they reach during the call:
+#   peakBytes is the most memory held at once during the call above what was held before it, and retainedBytes is what the call leaves allocated, its result
+#  Every function is called once before it is measured, so the lookup caches are filled and only the per-call allocations are left
+#  Run from the repository root: python benchmarks/bench_allocations.py
+
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ChannelWidthWeighting import weightEst, weightEst4, weightEstRecord
+from bench_weighting import getWeightingInput
+from payloads import getWeightEstArguments, payloads
+
+def getCases():
+    cases = {}
+    for numberMethods, path in ((2, "/weightest2/"), (3, "/weightest3/"), (4, "/weightest4/")):
+        arguments = getWeightEstArguments(payloads[path])
+        cases["weightEst {} methods".format(numberMethods)] = (weightEst, arguments)
+        cases["weightEstRecord {} methods".format(numberMethods)] = (weightEstRecord, (getWeightingInput(payloads[path]),))
+    cases["weightEst4"] = (weightEst4, getWeightEstArguments(payloads["/weightest4/"]))
+    return cases
+
+# Returns the smallest peak and retained bytes of a function call over repeat calls
+def measureCall(function, arguments, repeat):
+    function(*arguments)
+    peakSamples = []
+    retainedSamples = []
+    tracemalloc.start()
+    try:
+        for i in range(repeat):
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            result = function(*arguments)
+            current, peak = tracemalloc.get_traced_memory()
+            del result
+            peakSamples.append(peak - start)
+            retainedSamples.append(current - start)
+    finally:
+        tracemalloc.stop()
+    return {
+        "peakBytes": min(peakSamples),
+        "retainedBytes": min(retainedSamples),
+    }
+
+def run(repeat = 20):
+    return {name: measureCall(function, arguments, repeat) for name, (function, arguments) in getCases().items()}
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print("{:<28} peak {:6d} bytes   retained {:6d} bytes".format(name, result["peakBytes"], result["retainedBytes"]))
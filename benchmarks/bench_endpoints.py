@@ -0,0 +1,88 @@
+# Throughput and latency of the weighting endpoints, measured in process by calling the ASGI app in main.py directly
+#  Requests go through the whole app (middleware, routing, validation, weighting, and serialization) without a server or network
+#  Run from the repository root: python benchmarks/bench_endpoints.py
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from payloads import payloads
+
+# Minimal ASGI client: sends one POST request to the app and returns the response status
+async def post(app, path, body):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = []
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"localhost"), (b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000),
+        "server": ("localhost", 80),
+    }
+    await app(scope, receive, send)
+    return status[0]
+
+def getPercentile(sortedValues, percentile):
+    return sortedValues[min(len(sortedValues) - 1, int(len(sortedValues) * percentile / 100))]
+
+# Sends requests with the given number of concurrent clients and returns throughput and latency percentiles
+async def runRoute(app, path, body, requests, concurrency):
+    latencies = []
+
+    async def client(count):
+        for i in range(count):
+            start = time.perf_counter()
+            status = await post(app, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(path + " returned status " + str(status))
+
+    await client(min(requests, 100)) # warm up the caches
+    latencies.clear()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(requests // concurrency) for i in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "requestsPerSecond": len(latencies) / elapsed,
+        "p50Microseconds": getPercentile(latencies, 50) * 1e6,
+        "p95Microseconds": getPercentile(latencies, 95) * 1e6,
+        "p99Microseconds": getPercentile(latencies, 99) * 1e6,
+    }
+
+async def runAll(requests, concurrency):
+    results = {}
+    for path, payload in payloads.items():
+        routeRequests = requests if not isinstance(payload, list) else max(concurrency, requests // 100)
+        results[path] = await runRoute(main.app, path, json.dumps(payload).encode(), routeRequests, concurrency)
+    return results
+
+def run(requests = 5000, concurrency = 10):
+    return asyncio.run(runAll(requests, concurrency))
+
+if __name__ == "__main__":
+    for path, result in run().items():
+        print("{:<18} {:10.0f} req/s   p50 {:8.1f} us   p95 {:8.1f} us   p99 {:8.1f} us".format(path, result["requestsPerSecond"], result["p50Microseconds"], result["p95Microseconds"], result["p99Microseconds"]))
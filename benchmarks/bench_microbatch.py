@@ -0,0 +1,46 @@
+# Throughput and latency of the single-site endpoints weighted one request at a time and through the micro-batching dispatcher
+#  Requests go through the whole app in process, as in bench_endpoints.py; only the micro-batcher of main.py is switched between runs
+#  Run from the repository root: python benchmarks/bench_microbatch.py
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main
+from bench_endpoints import runRoute
+from micro_batching import MicroBatcher
+from payloads import payloads
+
+paths = ("/weightest2/", "/weightest3/", "/weightest/")
+
+# Dispatcher settings compared by the benchmark, as (window in seconds, maximum batch size); None weights each request on its own
+modes = {
+    "perRequest": None,
+    "microBatch1ms": (0.001, 64),
+}
+
+async def runAll(requests, concurrency):
+    results = {}
+    previousBatcher = main.microBatcher
+    try:
+        for mode, batcherSettings in modes.items():
+            for path in paths:
+                main.microBatcher = MicroBatcher(*batcherSettings) if batcherSettings else None
+                result = await runRoute(main.app, path, json.dumps(payloads[path]).encode(), requests, concurrency)
+                if main.microBatcher is not None:
+                    result["meanBatchSize"] = main.microBatcher.rows / max(1, main.microBatcher.batches)
+                results[mode + " " + path] = result
+    finally:
+        main.microBatcher = previousBatcher
+    return results
+
+def run(requests = 20000, concurrency = 64):
+    return asyncio.run(runAll(requests, concurrency))
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print("{:<28} {:10.0f} req/s   p50 {:8.1f} us   p99 {:8.1f} us{}".format(name, result["requestsPerSecond"], result["p50Microseconds"], result["p99Microseconds"], "   mean batch {:.1f}".format(result["meanBatchSize"]) if "meanBatchSize" in result else ""))
@@ -0,0 +1,42 @@
+# Throughput of parallel_weighting.weightEstParallel for different numbers of worker processes, compared with weightEstBatch in one process
+#  Run from the repository root: python benchmarks/bench_parallel.py
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ChannelWidthWeighting import weightEstBatch
+from parallel_weighting import getDefaultProcesses, weightEstParallel
+from payloads import getWeightEstArguments, payloads
+
+# Numbers of processes to time: powers of two up to the available cores, and the available cores
+def getProcessCounts():
+    cores = getDefaultProcesses()
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+def run(rows = 200000):
+    batch = [getWeightEstArguments(payload) for payload in payloads["/weightest/batch"]]
+    batch = (batch * (rows // len(batch) + 1))[:rows]
+
+    start = time.perf_counter()
+    weightEstBatch(batch)
+    results = {"weightEstBatch": {"rows": rows, "perRowMicroseconds": (time.perf_counter() - start) / rows * 1e6}}
+
+    for processes in getProcessCounts():
+        start = time.perf_counter()
+        weightEstParallel(batch, processes)
+        results["weightEstParallel " + str(processes)] = {"rows": rows, "processes": processes, "perRowMicroseconds": (time.perf_counter() - start) / rows * 1e6}
+    return results
+
+if __name__ == "__main__":
+    results = run(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+    for name, result in results.items():
+        print("{:<24} {:8.3f} us per row   {:10.0f} rows/s".format(name, result["perRowMicroseconds"], 1e6 / result["perRowMicroseconds"]))
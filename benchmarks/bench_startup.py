@@ -0,0 +1,69 @@
+# Cold start of the weighting service: import times and the latency of the first request, each measured in a fresh interpreter
+#  Run from the repository root: python benchmarks/bench_startup.py
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+benchmarksDirectory = os.path.dirname(os.path.abspath(__file__))
+repositoryDirectory = os.path.dirname(benchmarksDirectory)
+
+# Runs in the fresh interpreter and prints its timings as JSON
+measureScript = """
+import asyncio, json, sys, time
+sys.path[:0] = [{repositoryDirectory!r}, {benchmarksDirectory!r}]
+start = time.perf_counter()
+import ChannelWidthWeighting
+coreImported = time.perf_counter()
+numpyImported = "numpy" in sys.modules
+import main
+appImported = time.perf_counter()
+from bench_endpoints import post
+from payloads import payloads
+requestStart = time.perf_counter()
+status = asyncio.run(post(main.app, "/weightest/", json.dumps(payloads["/weightest/"]).encode()))
+requestDone = time.perf_counter()
+print(json.dumps({{
+    "status": status,
+    "numpyImportedByCore": numpyImported,
+    "coreImport": coreImported - start,
+    "appImport": appImported - coreImported,
+    "firstRequest": requestDone - requestStart,
+}}))
+""".format(repositoryDirectory=repositoryDirectory, benchmarksDirectory=benchmarksDirectory)
+
+# Settings compared by the benchmark, as environment variables
+modes = {
+    "default": {},
+    "docsDisabled": {"DOCS_ENABLED": "false"},
+}
+
+def measure(environment):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", measureScript], env=dict(os.environ, **environment), capture_output=True, text=True, check=True).stdout
+    timings = json.loads(output)
+    timings["process"] = time.perf_counter() - start
+    if timings["status"] != 200:
+        raise RuntimeError("/weightest/ returned status " + str(timings["status"]))
+    return timings
+
+# Medians of the timings over the given number of fresh interpreters per mode
+def run(repeat = 5):
+    results = {}
+    for mode, environment in modes.items():
+        samples = [measure(environment) for i in range(repeat)]
+        results[mode] = {
+            "numpyImportedByCore": samples[0]["numpyImportedByCore"],
+            "coreImportMicroseconds": statistics.median(sample["coreImport"] for sample in samples) * 1e6,
+            "appImportMicroseconds": statistics.median(sample["appImport"] for sample in samples) * 1e6,
+            "firstRequestMicroseconds": statistics.median(sample["firstRequest"] for sample in samples) * 1e6,
+            "processMicroseconds": statistics.median(sample["process"] for sample in samples) * 1e6,
+        }
+    return results
+
+if __name__ == "__main__":
+    for mode, result in run().items():
+        print("{:<14} core import {:8.1f} ms   app import {:8.1f} ms   first request {:8.1f} ms   process {:8.1f} ms".format(mode, result["coreImportMicroseconds"] / 1e3, result["appImportMicroseconds"] / 1e3, result["firstRequestMicroseconds"] / 1e3, result["processMicroseconds"] / 1e3))
@@ -0,0 +1,70 @@
+# Compares the pydantic request validation path with the lean validation path (settings.LEAN_VALIDATION)
+#  Each route handler is built both ways from the routes in main.py and called directly with an in-memory request, so the timings cover body parsing, validation, weighting, and response rendering
+#  Run from the repository root: python benchmarks/bench_validation.py
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+
+import main
+from lean_validation import LeanValidationRoute
+from payloads import payloads
+
+def buildHandler(routeClass, route):
+    return routeClass(
+        route.path,
+        route.endpoint,
+        methods=route.methods,
+        response_model=route.response_model,
+        response_class=route.response_class,
+    ).get_route_handler()
+
+def buildRequest(path, body):
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+    }
+    return Request(scope, receive)
+
+async def timeHandler(handler, path, body, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        await handler(buildRequest(path, body))
+    return (time.perf_counter() - start) / iterations
+
+async def run(iterations):
+    results = {}
+    for route in main.app.routes:
+        if not isinstance(route, APIRoute) or "POST" not in route.methods or route.path not in payloads or route.path == "/weightest/batch":
+            continue
+        body = json.dumps(payloads[route.path]).encode()
+        pydanticHandler = buildHandler(APIRoute, route)
+        leanHandler = buildHandler(LeanValidationRoute, route)
+        await timeHandler(pydanticHandler, route.path, body, 100) # warm up the caches
+        await timeHandler(leanHandler, route.path, body, 100)
+        pydanticTime = await timeHandler(pydanticHandler, route.path, body, iterations)
+        leanTime = await timeHandler(leanHandler, route.path, body, iterations)
+        results[route.path] = {
+            "pydanticMicroseconds": pydanticTime * 1e6,
+            "leanMicroseconds": leanTime * 1e6,
+            "speedup": pydanticTime / leanTime,
+        }
+    return results
+
+if __name__ == "__main__":
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for path, result in asyncio.run(run(iterations)).items():
+        print("{:<14} pydantic {:8.2f} us   lean {:8.2f} us   speedup {:.2f}x".format(path, result["pydanticMicroseconds"], result["leanMicroseconds"], result["speedup"]))
@@ -0,0 +1,79 @@
+# Micro-benchmarks of the weighting functions in ChannelWidthWeighting.py
+#  Run from the repository root: python benchmarks/bench_weighting.py
+
+import os
+import statistics
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ChannelWidthWeighting import WeightingInput, getCrossCorrelationCoefficient, setSEPCombinations, weightEst, weightEst2, weightEst3, weightEst4, weightEstCurve, weightEstRecord, weightEstSensitivity
+from payloads import getWeightEstArguments, payloads
+
+# weightEstCurve arguments for a weightest/curve request body
+def getWeightEstCurveArguments(payload):
+    estimates = payload["estimates"]
+    return ([estimate["method"] for estimate in estimates], [estimate["x"] for estimate in estimates], [estimate["sep"] for estimate in estimates], payload["regressionRegionCode"])
+
+# weightEstSensitivity arguments for a weightest request body, with every estimate perturbed by its SEP and every SEP by 0.1 log units
+def getWeightEstSensitivityArguments(payload, numberSamples):
+    arguments = getWeightEstArguments(payload)
+    return (list(arguments[0:4]), list(arguments[4:8]), arguments[8], list(arguments[9:13]), list(arguments[4:8]), 0.1, numberSamples, (0.05, 0.25, 0.5, 0.75, 0.95), False, 0)
+
+# weightEstRecord input for a weightest request body
+def getWeightingInput(payload):
+    arguments = getWeightEstArguments(payload)
+    return WeightingInput(arguments[0:4], arguments[4:8], arguments[8], arguments[9:13])
+
+def getCases():
+    weightEst2Payload = payloads["/weightest2/"]
+    weightEst3Payload = payloads["/weightest3/"]
+    weightEst4Arguments = getWeightEstArguments(payloads["/weightest4/"])
+    return {
+        "getCrossCorrelationCoefficient": (getCrossCorrelationCoefficient, ("GC1832", "ACPK66_7AE", "PK66_7AEP")),
+        "weightEst2": (weightEst2, (122, 8.24, 0.483, 0.376, weightEst2Payload["regressionRegionCode"], weightEst2Payload["code1"], weightEst2Payload["code2"])),
+        "weightEst3": (weightEst3, (122, 8.24, 45.9, 0.483, 0.376, 0.467, weightEst3Payload["regressionRegionCode"], weightEst3Payload["code1"], weightEst3Payload["code2"], weightEst3Payload["code3"])),
+        "weightEst4": (weightEst4, weightEst4Arguments),
+        "weightEst": (weightEst, getWeightEstArguments(payloads["/weightest/"])),
+        "weightEstRecord": (weightEstRecord, (getWeightingInput(payloads["/weightest/"]),)),
+        "weightEstCurve": (weightEstCurve, getWeightEstCurveArguments(payloads["/weightest/curve"])),
+        "weightEstSensitivity": (weightEstSensitivity, getWeightEstSensitivityArguments(payloads["/weightest/"], 100000)),
+    }
+
+# Times a function call; the number of calls per sample is chosen so a sample takes at least 0.2 s
+def timeCall(function, arguments, repeat):
+    timer = timeit.Timer(lambda: function(*arguments))
+    number, elapsed = timer.autorange()
+    samples = [elapsed / number for elapsed in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "calls": number * repeat,
+        "minMicroseconds": min(samples) * 1e6,
+        "medianMicroseconds": statistics.median(samples) * 1e6,
+    }
+
+def run(repeat = 5):
+    cases = getCases()
+    results = {}
+    for name, (function, arguments) in cases.items():
+        results[name] = timeCall(function, arguments, repeat)
+
+    #weightEst2 and weightEst3 again with their SEP combinations in the precomputed weight table
+    precomputedCases = {}
+    for name in ("weightEst2", "weightEst3"):
+        function, arguments = cases[name]
+        #The arguments are N estimates, N SEPs, the region, and N codes
+        numberMethods = (len(arguments) - 1) // 3
+        precomputedCases[name + "Precomputed"] = (function, arguments, (arguments[2 * numberMethods], tuple(arguments[2 * numberMethods + 1:]), tuple(arguments[numberMethods:2 * numberMethods])))
+    setSEPCombinations(combination for function, arguments, combination in precomputedCases.values())
+    try:
+        for name, (function, arguments, combination) in precomputedCases.items():
+            results[name] = timeCall(function, arguments, repeat)
+    finally:
+        setSEPCombinations([])
+    return results
+
+if __name__ == "__main__":
+    for name, result in run().items():
+        print("{:<32} min {:8.2f} us   median {:8.2f} us".format(name, result["minMicroseconds"], result["medianMicroseconds"]))
@@ -0,0 +1,25 @@
+# Request bodies shared by the benchmarks, taken from the examples in the pydantic schemas in main.py
+
+payloads = {
+    "/weightest/": {"x1": 122, "x2": None, "x3": None, "x4": 26.6, "sep1": 0.483, "sep2": None, "sep3": None, "sep4": 0.538, "regressionRegionCode": "GC1834", "code1": "ACPK66_7AE", "code2": None, "code3": None, "code4": "RSPK66_7AE"},
+    "/weightest2/": {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"},
+    "/weightest3/": {"x1": 122, "x2": 8.24, "x3": 45.9, "sep1": 0.483, "sep2": 0.376, "sep3": 0.467, "regressionRegionCode": "GC1833", "code1": "ACPK66_7AE", "code2": "PK66_7AEP", "code3": "BWPK66_7AE"},
+    "/weightest4/": {"x1": 122, "x2": 8.24, "x3": 45.9, "x4": 26.6, "sep1": 0.483, "sep2": 0.376, "sep3": 0.467, "sep4": 0.538, "regressionRegionCode": "GC1834", "code1": "ACPK66_7AE", "code2": "PK66_7AEP", "code3": "BWPK66_7AE", "code4": "RSPK66_7AE"},
+}
+
+# weightEst arguments for the same sites, in order: x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4
+def getWeightEstArguments(payload):
+    return tuple(payload.get(field) for field in ("x1", "x2", "x3", "x4", "sep1", "sep2", "sep3", "sep4", "regressionRegionCode", "code1", "code2", "code3", "code4"))
+
+# A batch of 100 records that mixes 2, 3, and 4 method sites
+payloads["/weightest/batch"] = [dict(payloads["/weightest/"], **{"code1": None, "x1": None, "sep1": None, "x2": 8.24, "sep2": 0.376, "code2": "PK66_7AEP"}), dict(payloads["/weightest4/"]), dict(payloads["/weightest/"])] * 33 + [dict(payloads["/weightest/"])]
+
+# The whole frequency curve of one site, with the example estimates of the weightest/curve endpoint
+payloads["/weightest/curve"] = {
+    "regressionRegionCode": "GC1832",
+    "estimates": [
+        {"method": "AC", "x": [21.3, 33.4, 38.7, 68.9, 101, 153, 200, 254, 316, 411], "sep": [0.478, 0.456, 0.451, 0.431, 0.427, 0.428, 0.433, 0.441, 0.451, 0.466]},
+        {"method": "BC", "x": [6.18, 12.4, 15.2, 33.8, 55.1, 93.2, 128, 168, 214, 285], "sep": [0.581, 0.512, 0.497, 0.451, 0.437, 0.439, 0.450, 0.466, 0.485, 0.513]},
+        {"method": "BW", "x": [15.5, 24.1, 28.0, 50.6, 75.3, 116, 152, 194, 242, 316], "sep": [0.522, 0.497, 0.491, 0.470, 0.466, 0.468, 0.474, 0.484, 0.495, 0.512]},
+    ],
+}
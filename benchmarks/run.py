@@ -0,0 +1,99 @@
+# Runs the benchmark suite and saves the results as JSON, so runs from different commits can be compared
+#  Run from the repository root:
+#   python benchmarks/run.py                                   saves benchmarks/results/<commit>.json
+#   python benchmarks/run.py --compare benchmarks/results/<other commit>.json
+#   python benchmarks/run.py --budget-p99 500                  fails if any endpoint p99 latency is over 500 microseconds
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+
+import bench_allocations
+import bench_endpoints
+import bench_startup
+import bench_validation
+import bench_weighting
+
+benchmarksDirectory = os.path.dirname(os.path.abspath(__file__))
+
+def getCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=benchmarksDirectory, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Returns the timing metrics of two result files that changed by more than the threshold, as (benchmark, metric, old, new, ratio)
+def compareResults(oldResults, newResults, threshold = 0.1):
+    changes = []
+    for suite in ("weighting", "endpoints", "validation", "startup"):
+        for name, metrics in newResults.get(suite, {}).items():
+            oldMetrics = oldResults.get(suite, {}).get(name, {})
+            for metric, value in metrics.items():
+                if not metric.endswith("Microseconds") or not oldMetrics.get(metric):
+                    continue
+                ratio = value / oldMetrics[metric]
+                if abs(ratio - 1) > threshold:
+                    changes.append((suite + " " + name, metric, oldMetrics[metric], value, ratio))
+    return changes
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the weighting service benchmarks and save the results as JSON.")
+    parser.add_argument("-o", "--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--requests", type=int, default=5000, help="requests per endpoint (default %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=10, help="concurrent clients per endpoint (default %(default)s)")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--budget-p99", type=float, help="p99 latency budget in microseconds for the single-site endpoints; exits with status 1 if it is exceeded")
+    arguments = parser.parse_args()
+
+    commit = getCommit()
+    results = {
+        "commit": commit,
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "weighting": bench_weighting.run(),
+        "allocations": bench_allocations.run(),
+        "endpoints": bench_endpoints.run(arguments.requests, arguments.concurrency),
+        "validation": asyncio.run(bench_validation.run(arguments.requests)),
+        "startup": bench_startup.run(),
+    }
+
+    output = arguments.output or os.path.join(benchmarksDirectory, "results", commit + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as outputFile:
+        json.dump(results, outputFile, indent=2)
+    print("Saved results to " + output)
+
+    for name, result in results["weighting"].items():
+        print("{:<32} median {:8.2f} us".format(name, result["medianMicroseconds"]))
+    for name, result in results["allocations"].items():
+        print("{:<32} peak {:6d} bytes   retained {:6d} bytes".format(name, result["peakBytes"], result["retainedBytes"]))
+    for path, result in results["endpoints"].items():
+        print("{:<32} {:8.0f} req/s   p50 {:8.1f} us   p99 {:8.1f} us".format(path, result["requestsPerSecond"], result["p50Microseconds"], result["p99Microseconds"]))
+    for mode, result in results["startup"].items():
+        print("startup {:<24} app import {:8.1f} ms   first request {:8.1f} ms   process {:8.1f} ms".format(mode, result["appImportMicroseconds"] / 1e3, result["firstRequestMicroseconds"] / 1e3, result["processMicroseconds"] / 1e3))
+
+    if arguments.compare:
+        with open(arguments.compare) as compareFile:
+            changes = compareResults(json.load(compareFile), results)
+        print("Changes of more than 10% since " + arguments.compare + ":" + ("" if changes else " none"))
+        for name, metric, oldValue, newValue, ratio in changes:
+            print("  {:<40} {:<20} {:10.2f} -> {:10.2f} us ({:+.0%})".format(name, metric, oldValue, newValue, ratio - 1))
+
+    if arguments.budget_p99 is not None:
+        overBudget = [path for path, result in results["endpoints"].items() if path != "/weightest/batch" and result["p99Microseconds"] > arguments.budget_p99]
+        if overBudget:
+            print("p99 latency budget of {:.0f} us exceeded by: {}".format(arguments.budget_p99, ", ".join(overBudget)))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
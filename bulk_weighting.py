@@ -0,0 +1,234 @@
+import argparse
+import csv
+import io
+import json
+import sys
+
+import settings
+from ChannelWidthWeighting import getCoefficientTables, weightEstBatch
+from weighting_errors import WeightingError
+
+######
+##
+## Bulk weighting of NDJSON and CSV files
+##
+######
+
+# Rows are read one line at a time and weighted in fixed-size chunks with weightEstBatch, and each chunk's results are written out before the next chunk is read
+#  Memory use depends on the chunk size, not on the number of rows
+# Each row has the same fields as the weightest endpoint request body; any other fields (ex. a site id) are copied to the output unchanged
+
+floatFields = ("x1", "x2", "x3", "x4", "sep1", "sep2", "sep3", "sep4")
+codeFields = ("regressionRegionCode", "code1", "code2", "code3", "code4")
+resultFields = ("Z", "SEPZ", "CI", "PIL", "PIU", "warning", "error", "errorId")
+
+mediaTypes = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Converts a row into the weightEst arguments; blank and null values are None
+def getRowArguments(record):
+    values = {}
+    for field in floatFields:
+        value = record.get(field)
+        if value is None or value == "":
+            values[field] = None
+            continue
+        try:
+            values[field] = float(value)
+        except (TypeError, ValueError):
+            raise WeightingError(field + ": value is not a valid float")
+    for field in codeFields:
+        value = record.get(field)
+        values[field] = None if value is None or value == "" else str(value)
+    #Rows that cannot be read as weightEst arguments fail with the invalid_input error, as the records of the batch endpoint do
+    if values["regressionRegionCode"] is None:
+        raise WeightingError("regressionRegionCode: field required")
+    return (
+        values["x1"], values["x2"], values["x3"], values["x4"],
+        values["sep1"], values["sep2"], values["sep3"], values["sep4"],
+        values["regressionRegionCode"],
+        values["code1"], values["code2"], values["code3"], values["code4"],
+    )
+
+# Weights a list of parsed rows and returns a (Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId) tuple for each one
+#  Rows that could not be parsed are passed as an error message string instead of a dict
+def weightRecords(records, coefficientTables = None):
+    results = [None] * len(records)
+    rows = []
+    rowIndices = []
+    for index, record in enumerate(records):
+        if isinstance(record, str):
+            results[index] = (None, None, None, None, None, None, record, WeightingError.errorId)
+            continue
+        try:
+            rows.append(getRowArguments(record))
+            rowIndices.append(index)
+        except WeightingError as e:
+            results[index] = (None, None, None, None, None, None, str(e), e.errorId)
+    for index, result in zip(rowIndices, weightEstBatch(rows, coefficientTables)):
+        results[index] = result
+    return results
+
+# Returns the values of a CSV record, or None if the record is not complete, ex. a quoted field that continues on the next line
+#  A record that cannot be read as CSV, ex. with a field over the csv module's field size limit, is returned as an error message string
+def readCSVRecord(text):
+    try:
+        #The strict reader only differs in raising errors, so it tells a record that ends inside a quoted field from a complete one
+        return next(csv.reader([text], strict=True))
+    except csv.Error as e:
+        if str(e) == "unexpected end of data":
+            return None
+    try:
+        return next(csv.reader([text]))
+    except csv.Error as e:
+        return "Line is not valid CSV: " + str(e)
+
+# Weights lines of NDJSON or CSV text in chunks
+#  feed() takes one input line, with its line ending, and returns the output lines that are ready, and finish() returns the rest once the input ends
+#  Lines can be bytes, ex. from iterateLines; a line that is not valid UTF-8 fails only its row, like a line that is not valid JSON or CSV
+#  A CSV record can span lines, inside quoted fields, so its lines are kept until the record is complete
+#  Every chunk is weighted with the coefficient tables that were current when the weighter was created
+class BulkWeighter:
+
+    def __init__(self, format, chunkSize = None):
+        if format not in mediaTypes:
+            raise ValueError("format must be one of: " + ", ".join(mediaTypes))
+        self.format = format
+        self.chunkSize = chunkSize or settings.STREAM_CHUNK_SIZE
+        self.coefficientTables = getCoefficientTables()
+        self.records = []
+        self.fieldnames = None # CSV header of the input
+        self.partialRecord = "" # Lines of a CSV record that continues on the next line
+
+    def feed(self, line):
+        if line.__class__ is bytes:
+            try:
+                line = line.decode("utf-8")
+            except UnicodeDecodeError as e:
+                message = "Line is not valid UTF-8: " + str(e)
+                if self.format == "csv":
+                    #The rest of a record the line is part of is dropped with it
+                    self.partialRecord = ""
+                    if self.fieldnames is None:
+                        return self.readHeader(message)
+                return self.addRecord(message)
+
+        if self.format == "csv":
+            if not self.partialRecord and not line.strip():
+                return []
+            values = readCSVRecord(self.partialRecord + line)
+            if values is None:
+                self.partialRecord += line
+                return []
+            self.partialRecord = ""
+            if self.fieldnames is None:
+                return self.readHeader(values)
+            return self.addRecord(values if isinstance(values, str) else dict(zip(self.fieldnames, values)))
+        else:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                return []
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = "Line is not valid JSON: " + str(e)
+            if not isinstance(record, (dict, str)):
+                record = "Line is not a JSON object."
+            return self.addRecord(record)
+
+    # Reads the CSV header, the values of its first record, and returns the output header line
+    #  A header that cannot be read, given as its error message, leaves no fields to read the rows with, so it is reported as an error row and the rows fail with their missing fields
+    def readHeader(self, values):
+        if isinstance(values, str):
+            self.fieldnames = []
+            return [self.formatCSV(list(resultFields))] + self.addRecord(values)
+        self.fieldnames = values
+        return [self.formatCSV(values + [field for field in resultFields if field not in values])]
+
+    # Buffers a parsed row, or the error message of a row that could not be parsed, and returns the output lines of the chunk once it is full
+    def addRecord(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.chunkSize:
+            return self.flush()
+        return []
+
+    def finish(self):
+        #A CSV record still open at the end of the input has a quoted field that is never closed
+        if self.partialRecord:
+            values = readCSVRecord(self.partialRecord)
+            self.partialRecord = ""
+            if self.fieldnames is not None:
+                self.records.append("Line is not valid CSV: unexpected end of data" if values is None else values)
+        return self.flush()
+
+    # Weights the buffered rows and returns their output lines
+    def flush(self):
+        records = self.records
+        self.records = []
+        if not records:
+            return []
+        return self.formatResults(records, weightRecords(records, self.coefficientTables))
+
+    def formatResults(self, records, results):
+        lines = []
+        for record, result in zip(records, results):
+            resultValues = dict(zip(resultFields, result))
+            if self.format == "csv":
+                resultValues = {field: "" if value is None else value for field, value in resultValues.items()}
+                values = dict(record, **resultValues) if isinstance(record, dict) else resultValues
+                lines.append(self.formatCSV([values.get(field, "") for field in self.fieldnames] + [resultValues[field] for field in resultFields if field not in self.fieldnames]))
+            elif isinstance(record, dict):
+                lines.append(json.dumps(dict(record, **resultValues)) + "\n")
+            else:
+                lines.append(json.dumps(resultValues) + "\n")
+        return lines
+
+    def formatCSV(self, values):
+        output = io.StringIO()
+        csv.writer(output, lineterminator="\n").writerow(values)
+        return output.getvalue()
+
+# Splits an async iterator of request body bytes into lines, each with its line ending, as lines are read from a file opened with newline=""
+#  The lines are left as bytes for BulkWeighter.feed to decode, so a line that is not valid UTF-8 fails only its row
+async def iterateLines(byteChunks):
+    buffer = b""
+    async for byteChunk in byteChunks:
+        buffer += byteChunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line + b"\n"
+    if buffer:
+        yield buffer
+
+# Reads the format from a file name or media type, defaulting to NDJSON
+def getFormat(name):
+    if name and (name.endswith(".csv") or name.split(";")[0].strip() == mediaTypes["csv"]):
+        return "csv"
+    return "ndjson"
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description="Weight the rows of an NDJSON or CSV file of estimates, one result per row.")
+    parser.add_argument("input", nargs="?", default="-", help="input file, or - for standard input (default)")
+    parser.add_argument("-o", "--output", default="-", help="output file, or - for standard output (default)")
+    parser.add_argument("-f", "--format", choices=sorted(mediaTypes), help="input and output format; by default read from the input file extension, or NDJSON")
+    parser.add_argument("-c", "--chunk-size", type=int, default=settings.STREAM_CHUNK_SIZE, help="number of rows weighted at a time (default %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    weighter = BulkWeighter(arguments.format or getFormat(arguments.input), arguments.chunk_size)
+    #Line endings are kept, so quoted CSV fields can contain them
+    inputFile = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="") if arguments.input == "-" else open(arguments.input, newline="")
+    outputFile = sys.stdout if arguments.output == "-" else open(arguments.output, "w", newline="")
+    try:
+        for line in inputFile:
+            outputFile.writelines(weighter.feed(line))
+        outputFile.writelines(weighter.finish())
+    finally:
+        if arguments.input != "-":
+            inputFile.close()
+        if outputFile is not sys.stdout:
+            outputFile.close()
+
+if __name__ == "__main__":
+    main()
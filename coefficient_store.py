@@ -0,0 +1,132 @@
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+
+######
+##
+## Binary coefficient store
+##
+######
+
+# Compact, fixed-layout copy of the cross-correlation coefficient tables that workers memory-map instead of each building their own nested dicts (settings.COEFFICIENT_STORE_PATH)
+#  The pages of the file are shared by every process that maps it, and they are only read from disk when a lookup first touches them
+# File layout:
+#  header: magic, format version, and metadata length, as "<8sII"
+#  metadata: UTF-8 JSON with the table version, hydrologic regions, regression region codes -> region id, method pairs, and AEPs, padded to a multiple of 8 bytes
+#  coefficients: little-endian float64 array of shape (regions, method pairs, AEPs), NaN where the tables have no coefficient
+
+storeMagic = b"CWCOEFFS"
+storeFormatVersion = 1
+headerFormat = struct.Struct("<8sII")
+
+defaultStorePath = "coefficient_store.bin"
+
+# Identifies one version of a file on disk, so that a replaced store file can be detected without reading it
+def getFileKey(path):
+    fileStat = os.stat(path)
+    return (fileStat.st_dev, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns)
+
+# Writes the store for a coefficient table and hydrologic regions table to path
+#  The file is written next to path and then renamed over it, so processes that have the old file mapped keep reading the old file and never see a partial one
+def buildCoefficientStore(path, coefficientTable, regionsTable, tableVersion):
+    hydrologicRegions = list(regionsTable)
+    methodPairs = []
+    AEPs = []
+    for hydrologicRegion in hydrologicRegions:
+        for methodPair, coefficients in coefficientTable.get(hydrologicRegion, {}).items():
+            if methodPair not in methodPairs:
+                methodPairs.append(methodPair)
+            for AEP in coefficients:
+                if AEP not in AEPs:
+                    AEPs.append(AEP)
+
+    coefficientArray = np.full((len(hydrologicRegions), len(methodPairs), len(AEPs)), np.nan, dtype="<f8")
+    for regionId, hydrologicRegion in enumerate(hydrologicRegions):
+        for methodPair, coefficients in coefficientTable.get(hydrologicRegion, {}).items():
+            for AEP, coefficient in coefficients.items():
+                coefficientArray[regionId, methodPairs.index(methodPair), AEPs.index(AEP)] = coefficient
+
+    metadata = json.dumps({
+        "tableVersion": tableVersion,
+        "hydrologicRegions": hydrologicRegions,
+        "regressionRegions": {
+            regressionRegionCode: regionId
+            for regionId, hydrologicRegion in enumerate(hydrologicRegions)
+            for regressionRegionCode in regionsTable[hydrologicRegion]
+        },
+        "methodPairs": [methodPair.split(",") for methodPair in methodPairs],
+        "AEPs": AEPs,
+    }).encode("utf-8")
+    metadata += b" " * (-(headerFormat.size + len(metadata)) % 8)
+
+    temporaryPath = path + ".tmp"
+    with open(temporaryPath, "wb") as storeFile:
+        storeFile.write(headerFormat.pack(storeMagic, storeFormatVersion, len(metadata)))
+        storeFile.write(metadata)
+        storeFile.write(coefficientArray.tobytes())
+    os.replace(temporaryPath, path)
+
+# Read-only view of a store file, with the same lookups as ChannelWidthWeighting.CoefficientIndex
+class CoefficientStore:
+
+    def __init__(self, path):
+        with open(path, "rb") as storeFile:
+            self.buffer = mmap.mmap(storeFile.fileno(), 0, access=mmap.ACCESS_READ)
+            fileStat = os.fstat(storeFile.fileno())
+        self.fileKey = (fileStat.st_dev, fileStat.st_ino, fileStat.st_size, fileStat.st_mtime_ns)
+        if len(self.buffer) < headerFormat.size:
+            raise ValueError(path + " is not a coefficient store.")
+        magic, formatVersion, metadataLength = headerFormat.unpack_from(self.buffer)
+        if magic != storeMagic or formatVersion != storeFormatVersion:
+            raise ValueError(path + " is not a coefficient store.")
+        metadata = json.loads(self.buffer[headerFormat.size:headerFormat.size + metadataLength].decode("utf-8"))
+
+        self.version = metadata["tableVersion"]
+        hydrologicRegions = metadata["hydrologicRegions"]
+        self.regionIds = metadata["regressionRegions"]
+        #Maps each regression region code to the hydrologic region that contains it
+        self.regressionRegions = {regressionRegionCode: hydrologicRegions[regionId] for regressionRegionCode, regionId in self.regionIds.items()}
+        #Both orders of each method pair are indexed so that lookups do not depend on the order of the codes
+        self.pairIds = {}
+        for pairId, (methodCode1, methodCode2) in enumerate(metadata["methodPairs"]):
+            self.pairIds[(methodCode1, methodCode2)] = pairId
+        for pairId, (methodCode1, methodCode2) in enumerate(metadata["methodPairs"]):
+            self.pairIds.setdefault((methodCode2, methodCode1), pairId)
+        self.AEPs = metadata["AEPs"]
+        self.AEPIds = {AEP: AEPId for AEPId, AEP in enumerate(self.AEPs)}
+
+        shape = (len(hydrologicRegions), len(metadata["methodPairs"]), len(metadata["AEPs"]))
+        self.coefficients = np.frombuffer(self.buffer, dtype="<f8", count=shape[0] * shape[1] * shape[2], offset=headerFormat.size + metadataLength).reshape(shape)
+
+    #Returns the coefficient, or None if the tables do not have one
+    def getCoefficient(self, regressionRegionCode, methodCode1, methodCode2, AEP):
+        regionId = self.regionIds.get(regressionRegionCode)
+        pairId = self.pairIds.get((methodCode1, methodCode2))
+        AEPId = self.AEPIds.get(AEP)
+        if regionId is None or pairId is None or AEPId is None:
+            return None
+        coefficient = float(self.coefficients[regionId, pairId, AEPId])
+        if math.isnan(coefficient):
+            return None
+        return coefficient
+
+def main(arguments = None):
+    from ChannelWidthWeighting import getTableVersion
+    from coefficient_table import crossCorrelationCoefficientTable
+    from hydrologic_region_table import hydrologicRegionsTable
+
+    parser = argparse.ArgumentParser(description="Build the binary coefficient store from coefficient_table.py and hydrologic_region_table.py.")
+    parser.add_argument("-o", "--output", default=defaultStorePath, help="store file to write (default %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    tableVersion = getTableVersion(crossCorrelationCoefficientTable, hydrologicRegionsTable)
+    buildCoefficientStore(arguments.output, crossCorrelationCoefficientTable, hydrologicRegionsTable, tableVersion)
+    print("Wrote " + arguments.output + " (table version " + tableVersion + ")")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+import argparse
+
+from ChannelWidthWeighting import droppedMethodWarning, getCoefficientTables, outsideRangeWarning
+from weighting_errors import InvalidTableError, WeightingError
+
+######
+##
+## Columnar weighting of Arrow and Parquet files
+##
+######
+
+# Weights a table with the same columns as the weightest endpoint request body (x1-x4, sep1-sep4, regressionRegionCode, code1-code4) and returns the table with
+#  Z, SEPZ, CI, PIL, PIU, warning, error, and errorId columns added; any other columns (ex. a site id) are kept unchanged
+# The value columns are read from the Arrow buffers as NumPy arrays and the code columns are dictionary encoded, so the table is never converted to Python rows as a whole;
+#  the rows are only decoded to Python values a chunk at a time to be weighted with weightEstBatch (see parallel_weighting.weightColumnRange), and the results are written back to NumPy arrays
+# Tables are read from and written to Arrow IPC (stream or file) and Parquet
+# pyarrow is optional and only imported when a table is read or weighted; NumPy is imported with it
+
+floatFields = ("x1", "x2", "x3", "x4", "sep1", "sep2", "sep3", "sep4")
+codeFields = ("code1", "code2", "code3", "code4")
+resultFields = ("Z", "SEPZ", "CI", "PIL", "PIU")
+
+mediaTypes = {
+    "arrows": "application/vnd.apache.arrow.stream",
+    "arrow": "application/vnd.apache.arrow.file",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+fileExtensions = {
+    ".arrows": "arrows",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".parquet": "parquet",
+}
+
+def importArrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("pyarrow must be installed to weight Arrow and Parquet files.") from e
+    return pyarrow
+
+# Reads the format from a file name or media type, defaulting to an Arrow IPC stream
+def getFormat(name):
+    if name:
+        mediaType = name.split(";")[0].strip()
+        for format, formatMediaType in mediaTypes.items():
+            if mediaType == formatMediaType:
+                return format
+        for extension, format in fileExtensions.items():
+            if name.endswith(extension):
+                return format
+    return "arrows"
+
+# Reads a table from a pyarrow buffer, file, or memory map
+#  Input that cannot be read in the format, ex. a truncated file, raises InvalidTableError
+def readTable(source, format):
+    pa = importArrow()
+    try:
+        if format == "parquet":
+            return pa.parquet.read_table(source)
+        #Either Arrow IPC format is accepted whatever the name says, since .arrow files are often written as streams
+        try:
+            return pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            if hasattr(source, "seek"):
+                source.seek(0)
+            return pa.ipc.open_stream(source).read_all()
+    #A stream cut off inside a message body raises an OSError instead of ArrowInvalid
+    except (pa.ArrowInvalid, OSError) as e:
+        raise InvalidTableError(InvalidTableError.message + " " + str(e)) from e
+
+# Writes a table in the given format and returns the bytes
+def writeTable(table, format):
+    pa = importArrow()
+    output = pa.BufferOutputStream()
+    if format == "parquet":
+        pa.parquet.write_table(table, output)
+    else:
+        writerClass = pa.ipc.new_file if format == "arrow" else pa.ipc.new_stream
+        with writerClass(output, table.schema) as writer:
+            writer.write_table(table)
+    return output.getvalue().to_pybytes()
+
+# Returns the codes of the field's string column as an int32 NumPy array of ids into codes, with -1 for nulls
+#  codes is a dict of code -> id that is extended with the codes of the column
+def getCodeIds(table, field, codes):
+    import numpy as np
+    pa = importArrow()
+
+    column = table.column(field).combine_chunks()
+    if not pa.types.is_dictionary(column.type):
+        if not pa.types.is_string(column.type) and not pa.types.is_large_string(column.type):
+            #Numbers are read as text, as the weightest endpoints read them; ex. lists or binary that is not UTF-8 cannot be
+            try:
+                column = column.cast(pa.string())
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise WeightingError(field + ": column is not text") from e
+        column = column.dictionary_encode()
+    #Maps the ids of the column's own dictionary to ids in codes; the last element maps null, id -1, to -1
+    dictionaryIds = np.array([codes.setdefault(str(code), len(codes)) for code in column.dictionary.to_pylist()] + [-1], dtype=np.int32)
+    indices = column.indices.fill_null(-1).to_numpy()
+    return dictionaryIds[indices]
+
+# Weights the rows of a pyarrow Table and returns a new table with the result columns added
+def weightEstTable(table, processes = 1, coefficientTables = None):
+    #processes above 1 weights the rows in a pool of processes with parallel_weighting.weightColumnsParallel, which loads the coefficient tables in each process
+    import numpy as np
+    pa = importArrow()
+    from parallel_weighting import weightColumnRange, weightColumnsParallel
+
+    #Tables and rows without a regressionRegionCode fail with the invalid_input error, as records without one do in the batch and stream endpoints
+    if "regressionRegionCode" not in table.column_names:
+        raise WeightingError("regressionRegionCode: column required")
+    numberRows = table.num_rows
+
+    #Missing columns are treated as all null
+    #  Nulls are marked in missingArray, so a NaN value is weighted as the value it is and fails its row with the nonfinite_value error
+    valueArray = np.full((numberRows, 8), np.nan)
+    missingArray = np.ones((numberRows, 8), dtype=bool)
+    for index, field in enumerate(floatFields):
+        if field in table.column_names:
+            column = table.column(field)
+            if not pa.types.is_floating(column.type) and not pa.types.is_integer(column.type) and not pa.types.is_null(column.type):
+                raise WeightingError(field + ": column is not numeric")
+            #Integers too large to be exact floats are rounded, as the weightest endpoints round them
+            valueArray[:, index] = column.cast(pa.float64(), safe=False).to_numpy()
+            missingArray[:, index] = column.is_null().to_numpy()
+
+    regionCodes = {}
+    regionIds = getCodeIds(table, "regressionRegionCode", regionCodes)
+    statisticCodes = {}
+    codeIds = np.full((numberRows, 4), -1, dtype=np.int32)
+    for index, field in enumerate(codeFields):
+        if field in table.column_names:
+            codeIds[:, index] = getCodeIds(table, field, statisticCodes)
+
+    if processes > 1:
+        resultArray, warningFlags, errors = weightColumnsParallel(valueArray[:, 0:4], valueArray[:, 4:8], missingArray, regionIds, codeIds, list(regionCodes), list(statisticCodes), processes)
+    else:
+        resultArray = np.full((numberRows, 5), np.nan)
+        warningFlags = np.zeros(numberRows, dtype=np.int8)
+        columns = (valueArray[:, 0:4], valueArray[:, 4:8], missingArray, regionIds, codeIds, resultArray, warningFlags)
+        errors = weightColumnRange(columns, list(regionCodes), list(statisticCodes), 0, numberRows, coefficientTables or getCoefficientTables())
+    #Rows with a null regressionRegionCode are weighted with None as the region, which fails them, and their error is replaced
+    for index in np.flatnonzero(regionIds == -1).tolist():
+        errors[index] = ("regressionRegionCode: field required", WeightingError.errorId)
+
+    #Result columns already in the input are replaced
+    table = table.drop([field for field in resultFields + ("warning", "error", "errorId") if field in table.column_names])
+    errorMask = np.zeros(numberRows, dtype=bool)
+    errorMask[list(errors)] = True
+    for index, field in enumerate(resultFields):
+        table = table.append_column(field, pa.array(resultArray[:, index], mask=errorMask))
+    #Warnings are dictionary encoded by their flags; rows without warnings are null
+    warnings = [outsideRangeWarning, droppedMethodWarning, outsideRangeWarning + droppedMethodWarning]
+    table = table.append_column("warning", pa.DictionaryArray.from_arrays(pa.array(warningFlags - 1, mask=warningFlags == 0), pa.array(warnings, pa.string())))
+    errorMessages = [None] * numberRows
+    errorIds = [None] * numberRows
+    for index, (errorMessage, errorId) in errors.items():
+        errorMessages[index] = errorMessage
+        errorIds[index] = errorId
+    table = table.append_column("error", pa.array(errorMessages, pa.string()))
+    #Error ids are dictionary encoded, since there are only a few of them
+    return table.append_column("errorId", pa.array(errorIds, pa.string()).dictionary_encode())
+
+# Reads, weights, and writes a whole Arrow or Parquet file held in memory
+def weightEstColumnar(data, format, processes = 1, coefficientTables = None):
+    #data is the bytes of the file; the result is written in the same format
+    pa = importArrow()
+    table = readTable(pa.BufferReader(data), format)
+    return writeTable(weightEstTable(table, processes, coefficientTables), format)
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description="Weight the rows of an Arrow IPC or Parquet file of estimates and write the results in the same format.")
+    parser.add_argument("input", help="input file")
+    parser.add_argument("-o", "--output", required=True, help="output file")
+    parser.add_argument("-f", "--format", choices=sorted(mediaTypes), help="input and output format; by default read from the input file extension, or an Arrow IPC stream")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="number of worker processes (default %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    pa = importArrow()
+    format = arguments.format or getFormat(arguments.input)
+    #The input is memory-mapped, so Arrow IPC columns are read from the file's pages without copying
+    with pa.memory_map(arguments.input) as inputFile:
+        table = weightEstTable(readTable(inputFile, format), arguments.processes)
+    with open(arguments.output, "wb") as outputFile:
+        outputFile.write(writeTable(table, format))
+
+if __name__ == "__main__":
+    main()
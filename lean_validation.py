@@ -0,0 +1,203 @@
+import asyncio
+import email.message
+import json
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.dependencies.utils import request_params_to_args
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import HTTPException, RequestValidationError
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from pydantic.error_wrappers import ErrorWrapper
+from pydantic.errors import DictError, FloatError, ListError, MissingError, NoneIsNotAllowedError, StrError
+from pydantic.fields import SHAPE_LIST, SHAPE_SINGLETON
+
+######
+##
+## Lean request validation
+##
+######
+
+# Opt-in replacement for pydantic request body validation (settings.LEAN_VALIDATION)
+#  Request bodies are decoded straight into slotted records using field checks compiled once from the pydantic models in main.py
+#  Valid bodies never construct a pydantic model; invalid bodies raise the same RequestValidationError errors pydantic would
+
+# Returned by the field checks for values that do not pass, so that failed checks do not need to raise
+INVALID = object()
+
+# Same coercion as pydantic's float_validator
+def checkFloat(value):
+    if value.__class__ is float:
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return INVALID
+
+# Same coercion as pydantic's str_validator for values that can come from JSON
+def checkStr(value):
+    if value.__class__ is str:
+        return value
+    if isinstance(value, (float, int)):
+        return str(value)
+    return INVALID
+
+fieldChecks = {
+    float: (checkFloat, FloatError),
+    str: (checkStr, StrError),
+}
+
+# Builds a decoder for a pydantic model with float and str fields
+#  Returns None if the model has fields the lean decoder does not support
+def compileRecordDecoder(model):
+    fields = []
+    for name, field in model.__fields__.items():
+        if field.shape != SHAPE_SINGLETON or field.type_ not in fieldChecks or field.alias != name:
+            return None
+        check, error = fieldChecks[field.type_]
+        fields.append((name, check, error, field.required, field.allow_none, field.default))
+    fields = tuple(fields)
+
+    recordType = type(model.__name__ + "Record", (), {"__slots__": tuple(name for name, *rest in fields)})
+
+    # Returns the record, or None after appending ErrorWrappers to errors
+    def decodeRecord(data, loc, errors):
+        if data.__class__ is not dict:
+            try:
+                data = dict(data)
+            except (TypeError, ValueError):
+                errors.append(ErrorWrapper(DictError(), loc=loc))
+                return None
+
+        record = recordType()
+        valid = True
+        for name, check, error, required, allowNone, default in fields:
+            value = data.get(name, INVALID)
+            if value is INVALID:
+                if required:
+                    errors.append(ErrorWrapper(MissingError(), loc=loc + (name,)))
+                    valid = False
+                    continue
+                value = default
+            elif value is None:
+                if not allowNone:
+                    errors.append(ErrorWrapper(NoneIsNotAllowedError(), loc=loc + (name,)))
+                    valid = False
+                    continue
+            else:
+                value = check(value)
+                if value is INVALID:
+                    errors.append(ErrorWrapper(error(), loc=loc + (name,)))
+                    valid = False
+                    continue
+            setattr(record, name, value)
+
+        if not valid:
+            return None
+        return record
+
+    return decodeRecord
+
+# Builds a decoder for a request body field whose type is a supported model or a list of one
+#  Returns None if the field is not supported
+def compileBodyDecoder(bodyField):
+    if not (isinstance(bodyField.type_, type) and issubclass(bodyField.type_, BaseModel)):
+        return None
+    decodeRecord = compileRecordDecoder(bodyField.type_)
+    if decodeRecord is None:
+        return None
+
+    if bodyField.shape == SHAPE_SINGLETON:
+        def decodeBody(data, errors):
+            return decodeRecord(data, ("body",), errors)
+    elif bodyField.shape == SHAPE_LIST:
+        def decodeBody(data, errors):
+            if data.__class__ is not list:
+                errors.append(ErrorWrapper(ListError(), loc=("body",)))
+                return None
+            records = []
+            for index, item in enumerate(data):
+                #pydantic rejects a null item before it tries to read it as a dict
+                if item is None:
+                    errors.append(ErrorWrapper(NoneIsNotAllowedError(), loc=("body", index)))
+                    continue
+                records.append(decodeRecord(item, ("body", index), errors))
+            if errors:
+                return None
+            return records
+    else:
+        return None
+
+    return decodeBody
+
+# Parses the raw request body the same way FastAPI does for JSON bodies
+def parseBody(bodyBytes, contentType):
+    if not bodyBytes:
+        return None
+    if contentType:
+        message = email.message.Message()
+        message["content-type"] = contentType
+        if message.get_content_maintype() != "application":
+            return bodyBytes
+        subtype = message.get_content_subtype()
+        if subtype != "json" and not subtype.endswith("+json"):
+            return bodyBytes
+    try:
+        return json.loads(bodyBytes)
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([ErrorWrapper(e, ("body", e.pos))], body=e.doc)
+    #Anything else, ex. a body that is not valid UTF-8, is a 400 as FastAPI answers it
+    except Exception as e:
+        raise HTTPException(status_code=400, detail="There was an error parsing the body") from e
+
+# Route class that uses the lean decoders for endpoints with a single model body and optional query parameters
+#  Any other endpoint is handled by the regular FastAPI request handler
+class LeanValidationRoute(APIRoute):
+
+    def get_route_handler(self):
+        dependant = self.dependant
+        decodeBody = None
+        if (
+            self.body_field is not None
+            and len(dependant.body_params) == 1
+            and not dependant.dependencies
+            and not dependant.path_params
+            and not dependant.header_params
+            and not dependant.cookie_params
+            and dependant.request_param_name is None
+            and dependant.response_param_name is None
+        ):
+            decodeBody = compileBodyDecoder(self.body_field)
+        if decodeBody is None:
+            return super().get_route_handler()
+
+        bodyName = dependant.body_params[0].name
+        queryParams = dependant.query_params
+        endpoint = dependant.call
+        isCoroutine = asyncio.iscoroutinefunction(endpoint)
+
+        async def app(request):
+            body = parseBody(await request.body(), request.headers.get("content-type"))
+            errors = []
+            if body is None:
+                errors.append(ErrorWrapper(MissingError(), loc=("body",)))
+                values = {}
+            else:
+                values = {bodyName: decodeBody(body, errors)}
+            if queryParams:
+                queryValues, queryErrors = request_params_to_args(queryParams, request.query_params)
+                values.update(queryValues)
+                errors = queryErrors + errors
+            if errors:
+                raise RequestValidationError(errors, body=body)
+
+            if isCoroutine:
+                rawResponse = await endpoint(**values)
+            else:
+                rawResponse = await run_in_threadpool(endpoint, **values)
+            if isinstance(rawResponse, Response):
+                return rawResponse
+            return JSONResponse(jsonable_encoder(rawResponse))
+
+        return app
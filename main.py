@@ -1,18 +1,43 @@
-from fastapi import FastAPI, HTTPException, Response
-from fastapi.responses import RedirectResponse
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
+from functools import lru_cache
+import hashlib
+import importlib
+from time import perf_counter
+from typing import Any, Dict, List
+import asyncio
 import json
+import logging
+import math
 
-from ChannelWidthWeighting import weightEst, weightEst2, weightEst3, weightEst4
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+import metrics
+import settings
+from weighting_errors import WeightingError
+from ChannelWidthWeighting import getCoefficientTables, getCorrelationCacheInfo, reloadCoefficientTables, weightEst, weightEst2, weightEst3, weightEst4, weightEstBatch, weightEstCurve, weightEstSensitivity, defaultSensitivityQuantiles
 
+
+# The OpenAPI schema is only generated when /openapi.json is first requested; with settings.DOCS_ENABLED off the docs routes are not added at all
 app = FastAPI(
     title='Channel Width Weighting Services',
-    openapi_url='/openapi.json',
-    docs_url='/docs'
+    openapi_url='/openapi.json' if settings.DOCS_ENABLED else None,
+    docs_url='/docs' if settings.DOCS_ENABLED else None,
+    redoc_url='/redoc' if settings.DOCS_ENABLED else None
 )
 
+# The lean validation path must be selected before any routes are added
+#  The modules of optional features are only imported when the feature is enabled, so they add nothing to startup otherwise
+if settings.LEAN_VALIDATION:
+    from lean_validation import LeanValidationRoute, compileRecordDecoder
+    app.router.route_class = LeanValidationRoute
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -21,6 +46,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Added last so that it is the outermost middleware and times the whole request
+if metrics.enabled:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 ######
 ##
 ## Pydantic Schemas
@@ -157,6 +186,331 @@ class WeightEst4(BaseModel):
             }
         }
 
+class WeightEstCurveMethod(BaseModel):
+
+    method: str = Field(..., title="Estimation Method", description="Code for the estimation method: BC (or PK), AC, BW, or RS", example="AC")
+    x: List[float] = Field(..., title="Statistic Values", description="Values of the statistic for each AEP, Q66.7 through Q0.2 (float)")
+    sep: List[float] = Field(..., title="SEP Values", description="Mean standard error of prediction values of the statistic for each AEP, Q66.7 through Q0.2 (float)")
+
+class WeightEstCurve(BaseModel):
+
+    regressionRegionCode: str = Field(..., title="Regression Region Code", description="Code for regression region", example="GC1832")
+    estimates: List[WeightEstCurveMethod] = Field(..., title="Estimates", description="Estimates of 2 to 4 estimation methods for every AEP")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "regressionRegionCode": "GC1832",
+                "estimates": [
+                    {
+                        "method": "AC",
+                        "x": [21.3, 33.4, 38.7, 68.9, 101, 153, 200, 254, 316, 411],
+                        "sep": [0.478, 0.456, 0.451, 0.431, 0.427, 0.428, 0.433, 0.441, 0.451, 0.466]
+                    },
+                    {
+                        "method": "BC",
+                        "x": [6.18, 12.4, 15.2, 33.8, 55.1, 93.2, 128, 168, 214, 285],
+                        "sep": [0.581, 0.512, 0.497, 0.451, 0.437, 0.439, 0.450, 0.466, 0.485, 0.513]
+                    }
+                ]
+            }
+        }
+
+class WeightEstSensitivity(WeightEst):
+
+    xSigma1: float = Field(default=None, title="Statistic Perturbation 1", description="Standard deviation, in log units, of the normal perturbation of the log of the first statistic (float); null leaves it unperturbed", example="0.483")
+    xSigma2: float = Field(default=None, title="Statistic Perturbation 2", description="Standard deviation, in log units, of the normal perturbation of the log of the second statistic (float); null leaves it unperturbed", example="null")
+    xSigma3: float = Field(default=None, title="Statistic Perturbation 3", description="Standard deviation, in log units, of the normal perturbation of the log of the third statistic (float); null leaves it unperturbed", example="null")
+    xSigma4: float = Field(default=None, title="Statistic Perturbation 4", description="Standard deviation, in log units, of the normal perturbation of the log of the fourth statistic (float); null leaves it unperturbed", example="0.538")
+    sepSigma1: float = Field(default=None, title="SEP Perturbation 1", description="Standard deviation, in log units, of the normal perturbation of the log of the first SEP value (float); null leaves it unperturbed", example="0.1")
+    sepSigma2: float = Field(default=None, title="SEP Perturbation 2", description="Standard deviation, in log units, of the normal perturbation of the log of the second SEP value (float); null leaves it unperturbed", example="null")
+    sepSigma3: float = Field(default=None, title="SEP Perturbation 3", description="Standard deviation, in log units, of the normal perturbation of the log of the third SEP value (float); null leaves it unperturbed", example="null")
+    sepSigma4: float = Field(default=None, title="SEP Perturbation 4", description="Standard deviation, in log units, of the normal perturbation of the log of the fourth SEP value (float); null leaves it unperturbed", example="0.1")
+    samples: int = Field(default=10000, title="Samples", description="Number of Monte Carlo samples (integer)", example=10000)
+    seed: int = Field(default=None, title="Seed", description="Seed of the random samples, to make the results repeatable (integer, not negative)", example="null")
+    quantiles: List[float] = Field(default=list(defaultSensitivityQuantiles), title="Quantiles", description="Quantiles of the sampled results to return, each from 0 to 1 (float)")
+
+    class Config:
+        null = None
+        schema_extra = {
+            "example": {
+                "x1": 122,
+                "x2": null,
+                "x3": null,
+                "x4": 26.6,
+                "sep1": 0.483,
+                "sep2": null,
+                "sep3": null,
+                "sep4": 0.538,
+                "regressionRegionCode": "GC1834",
+                "code1": "ACPK66_7AE",
+                "code2": null,
+                "code3": null,
+                "code4": "RSPK66_7AE",
+                "xSigma1": 0.483,
+                "xSigma4": 0.538,
+                "sepSigma1": 0.1,
+                "sepSigma4": 0.1,
+                "samples": 10000,
+                "quantiles": list(defaultSensitivityQuantiles)
+            }
+        }
+
+class WeightEstResult(BaseModel):
+
+    Z: float = Field(..., title="Weighted Estimate", description="Weighted estimate (float)")
+    SEPZ: float = Field(..., title="Weighted SEP", description="Mean standard error of prediction of the weighted estimate (float)")
+    CI: float = Field(..., title="Confidence Interval", description="Confidence interval in log units (float)")
+    PIL: float = Field(..., title="Prediction Interval-Lower", description="Lower prediction interval (float)")
+    PIU: float = Field(..., title="Prediction Interval-Upper", description="Upper prediction interval (float)")
+
+class WeightEstBatchResult(BaseModel):
+
+    Z: float = Field(default=None, title="Weighted Estimate", description="Weighted estimate, or null if the record could not be weighted (float)")
+    SEPZ: float = Field(default=None, title="Weighted SEP", description="Mean standard error of prediction of the weighted estimate (float)")
+    CI: float = Field(default=None, title="Confidence Interval", description="Confidence interval in log units (float)")
+    PIL: float = Field(default=None, title="Prediction Interval-Lower", description="Lower prediction interval (float)")
+    PIU: float = Field(default=None, title="Prediction Interval-Upper", description="Upper prediction interval (float)")
+    warning: str = Field(default=None, title="Warning", description="Warning message about the validity of the result")
+    error: str = Field(default=None, title="Error", description="Reason the record could not be weighted")
+    errorId: str = Field(default=None, title="Error Id", description="Machine-readable id of the error, ex. invalid_region")
+
+class WeightEstCurveResult(BaseModel):
+
+    AEP: str = Field(..., title="AEP", description="Annual exceedance probability of the flow statistic, ex. Q0.2")
+    Z: float = Field(..., title="Weighted Estimate", description="Weighted estimate (float)")
+    SEPZ: float = Field(..., title="Weighted SEP", description="Mean standard error of prediction of the weighted estimate (float)")
+    CI: float = Field(..., title="Confidence Interval", description="Confidence interval in log units (float)")
+    PIL: float = Field(..., title="Prediction Interval-Lower", description="Lower prediction interval (float)")
+    PIU: float = Field(..., title="Prediction Interval-Upper", description="Upper prediction interval (float)")
+    warning: str = Field(default=None, title="Warning", description="Warning message about the validity of the result")
+
+class WeightEstSensitivitySummary(BaseModel):
+
+    mean: float = Field(..., title="Mean", description="Mean over the samples (float)")
+    quantiles: List[float] = Field(..., title="Quantiles", description="Values at each of the requested quantiles (float)")
+
+class WeightEstSensitivityResult(WeightEstResult):
+
+    samples: int = Field(..., title="Samples", description="Number of Monte Carlo samples (integer)")
+    quantiles: List[float] = Field(..., title="Quantiles", description="Quantiles of the summaries (float)")
+    summaries: Dict[str, WeightEstSensitivitySummary] = Field(..., title="Summaries", description="Mean and quantiles of Z, SEPZ, PIL, and PIU over the samples")
+
+######
+##
+## Result cache
+##
+######
+
+# Repeated identical requests return the cached result of the weighting function instead of recomputing it (settings.RESULT_CACHE_SIZE)
+if settings.RESULT_CACHE_SIZE > 0:
+    from result_cache import ResultCache
+    resultCache = ResultCache(settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTL)
+else:
+    resultCache = None
+
+# Weights with the current coefficient tables and returns the result followed by their version
+#  The tables are passed as the last argument, so cached results are keyed by the tables they were computed with
+def getWeightingResult(function, *arguments):
+    coefficientTables = getCoefficientTables()
+    arguments += (coefficientTables,)
+    if resultCache is None:
+        result = function(*arguments)
+    else:
+        result = resultCache.call(function, arguments)
+    return result + (coefficientTables.version,)
+
+######
+##
+## Micro-batching
+##
+######
+
+# Concurrent single-site POST requests are gathered for settings.MICROBATCH_WINDOW seconds and weighted together in one vectorized call
+if settings.MICROBATCH_WINDOW > 0:
+    from micro_batching import MicroBatcher
+    microBatcher = MicroBatcher(settings.MICROBATCH_WINDOW, settings.MICROBATCH_SIZE)
+else:
+    microBatcher = None
+
+# Returns the weightEst arguments of a single-site weighting call, or None for calls the vectorized functions do not support
+def getBatchRow(function, arguments):
+    if function is weightEst:
+        return arguments
+    if function is weightEst2:
+        x1, x2, SEP1, SEP2, regressionRegionCode, code1, code2 = arguments
+        return (x1, x2, None, None, SEP1, SEP2, None, None, regressionRegionCode, code1, code2, None, None)
+    if function is weightEst3:
+        x1, x2, x3, SEP1, SEP2, SEP3, regressionRegionCode, code1, code2, code3 = arguments
+        return (x1, x2, x3, None, SEP1, SEP2, SEP3, None, regressionRegionCode, code1, code2, code3, None)
+    if function is weightEst4 and not arguments[13]:
+        return arguments[:13]
+    return None
+
+# Same as getWeightingResult, but weighted by the micro-batcher when it is enabled
+#  Results are cached the same way, so cached results are returned without waiting for a batch
+async def getDispatchedWeightingResult(function, *arguments):
+    row = getBatchRow(function, arguments) if microBatcher is not None else None
+    if row is None:
+        return getWeightingResult(function, *arguments)
+
+    coefficientTables = getCoefficientTables()
+    if resultCache is not None:
+        key = (function.__name__,) + arguments + (coefficientTables,)
+        result = resultCache.get(key)
+        if result is not None:
+            return result + (coefficientTables.version,)
+    result = await microBatcher.weight(row, coefficientTables)
+    if resultCache is not None:
+        resultCache.put(key, result)
+    return result + (coefficientTables.version,)
+
+######
+##
+## Request coalescing
+##
+######
+
+# Identical requests whose weighting is handed off to the threadpool share one threadpool job while it runs, instead of each queueing their own (settings.COALESCE_REQUESTS)
+#  The shared job returns the serialized response body, so it is also only serialized once
+#  Single-site requests are weighted on the event loop in microseconds, so identical ones can never be in flight at the same time and are not coalesced
+if settings.COALESCE_REQUESTS:
+    from single_flight import SingleFlight
+    singleFlight = SingleFlight()
+else:
+    singleFlight = None
+
+# Returns function(*arguments), run in the threadpool
+#  key must include everything the result depends on, including the coefficient tables
+async def runCoalesced(key, function, *arguments):
+    if singleFlight is None:
+        return await run_in_threadpool(function, *arguments)
+    return await singleFlight.call(key, run_in_threadpool, function, *arguments)
+
+######
+##
+## Responses
+##
+######
+
+# Returns the content with NaN and infinite floats replaced by None, as orjson serializes them
+def getFiniteContent(content):
+    if isinstance(content, float):
+        return content if math.isfinite(content) else None
+    if isinstance(content, dict):
+        return {key: getFiniteContent(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [getFiniteContent(value) for value in content]
+    return content
+
+# Weighting results are plain dicts of floats and strings, so they are serialized directly instead of going through jsonable_encoder and the response_model
+#  orjson is used when it is installed; otherwise json writes the same output, with NaN and infinity as null as orjson writes them
+class WeightingResponse(JSONResponse):
+
+    def render(self, content):
+        if metrics.enabled:
+            serializationStart = perf_counter()
+        if orjson is not None:
+            body = orjson.dumps(content)
+        else:
+            try:
+                body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+            except ValueError:
+                #orjson writes NaN and infinity as null, so the fallback does too instead of failing the response
+                body = json.dumps(getFiniteContent(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+        if metrics.enabled:
+            metrics.observeStage("serialization", perf_counter() - serializationStart)
+        return body
+
+# The warning header only ever holds a few distinct messages, so each one is serialized once
+@lru_cache(maxsize=64)
+def getMessagesHeader(warningMessage):
+    return json.dumps({'warning': warningMessage})
+
+# Every endpoint returns its response already serialized, so the response models only document the responses
+#  FastAPI copies the fields of a route's response model when the route is added, so without the docs they are left out to make startup faster
+def getResponseModel(model):
+    return model if settings.DOCS_ENABLED else None
+
+# Documents a request body that is read raw, in any of the media types of a bulk weighting module
+#  The module is only imported for the docs; without them nothing is documented
+def getRawRequestBodyDocs(moduleName, schema):
+    if not settings.DOCS_ENABLED:
+        return None
+    mediaTypes = importlib.import_module(moduleName).mediaTypes
+    return {"requestBody": {"content": {mediaType: {"schema": schema} for mediaType in mediaTypes.values()}, "required": True}}
+
+# Every weighting response names the version of the coefficient tables it was weighted with
+exposeHeaders = "X-USGSWIM-Messages, X-USGSWIM-Table-Version"
+
+def getWeightingResponse(Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion, headers = None):
+    headers = dict(headers or {}, **{"Access-Control-Expose-Headers": exposeHeaders, "X-USGSWIM-Table-Version": tableVersion})
+    if warningMessage is not None:
+        headers["X-USGSWIM-Messages"] = getMessagesHeader(warningMessage)
+    return WeightingResponse({
+        "Z": Z,
+        "SEPZ": SEPZ,
+        "CI": CI,
+        "PIL": PIL,
+        "PIU": PIU
+    }, headers=headers)
+
+# Weighting errors are invalid inputs, so they are answered with their 4xx status code and a machine-readable errorId instead of a 500 that clients would retry
+#  The detail message is the same as before, ex. {"detail": "regressionRegionCode not valid.", "errorId": "invalid_region"}
+@app.exception_handler(WeightingError)
+async def weightingErrorHandler(request, e):
+    return WeightingResponse({"detail": str(e), "errorId": e.errorId}, status_code=e.statusCode)
+
+# Returns the exception an endpoint raises for an error: a weighting error is raised as it is, for weightingErrorHandler, and anything else is a 500 with its message
+def getErrorException(e):
+    if isinstance(e, WeightingError):
+        return e
+    return HTTPException(status_code = 500, detail = str(e))
+
+# Weighting results depend only on the inputs and the coefficient tables, so the GET endpoints can be cached by browsers and CDNs
+#  The strong ETag is a hash of the route, the table version, and the inputs
+cacheControl = "public, max-age=" + str(settings.HTTP_CACHE_MAX_AGE)
+
+def getETag(path, tableVersion, arguments):
+    return '"' + hashlib.sha256(json.dumps([path, tableVersion, arguments]).encode("utf-8")).hexdigest()[:32] + '"'
+
+# If-None-Match uses the weak comparison, so W/ prefixes are ignored
+def matchesETag(ifNoneMatch, etag):
+    if not ifNoneMatch:
+        return False
+    for candidate in ifNoneMatch.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.replace("W/", "", 1) == etag:
+            return True
+    return False
+
+# Weights the inputs and returns them with caching headers, or 304 Not Modified if the client already has the result
+#  The inputs are always weighted first, so inputs that are not valid are answered with their error even with If-None-Match: *; repeated inputs are answered from the result cache
+#  The 304 has the same headers as the 200 response, so caches that update their stored headers from it keep them
+def getCacheableWeightingResponse(request, function, *arguments):
+    try:
+        Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion = getWeightingResult(function, *arguments)
+    except Exception as e:
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+    etag = getETag(request.url.path, tableVersion, arguments)
+    response = getWeightingResponse(Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion, {"ETag": etag, "Cache-Control": cacheControl})
+    response.headers["Access-Control-Expose-Headers"] = exposeHeaders + ", ETag"
+    if matchesETag(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={name: value for name, value in response.headers.items() if name not in ("content-length", "content-type")})
+    return response
+
+# Streams the response while the request body is still being read
+#  StreamingResponse listens for a client disconnect by reading from receive, which would take request body chunks away from the endpoint, so this response only sends
+class BodyStreamingResponse(StreamingResponse):
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
 ######
 ##
 ## API Endpoints
@@ -165,15 +519,21 @@ class WeightEst4(BaseModel):
 
 
 # redirect root and /settings.SERVICE_NAME to the docs
-@app.get("/", include_in_schema=False)
-def docs_redirect_root():
-    return RedirectResponse(url=app.docs_url)
+if settings.DOCS_ENABLED:
+    @app.get("/", include_in_schema=False)
+    def docs_redirect_root():
+        return RedirectResponse(url=app.docs_url)
+
+# The weighting endpoints are async: the weighting math takes microseconds, so it runs directly on the event loop instead of being handed to a threadpool worker
+@app.post("/weightest/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest(request_body: WeightEst):
 
-@app.post("/weightest/")
-def weightest(request_body: WeightEst, response: Response):
+    if metrics.enabled:
+        metrics.observeValidation()
 
     try:
-        Z, SEPZ, CI, PIL, PIU, warningMessage  = weightEst(
+        Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion = await getDispatchedWeightingResult(
+            weightEst,
             request_body.x1,
             request_body.x2,
             request_body.x3,
@@ -188,25 +548,22 @@ def weightest(request_body: WeightEst, response: Response):
             request_body.code3,
             request_body.code4,
         )
-        if warningMessage is not None:
-            response.headers["X-USGSWIM-Messages"] = json.dumps({'warning': warningMessage})
-        response.headers["Access-Control-Expose-Headers"] = "X-USGSWIM-Messages"
-        return {
-            "Z": Z,
-            "SEPZ": SEPZ,
-            "CI": CI,
-            "PIL": PIL,
-            "PIU": PIU
-        }
+        return getWeightingResponse(Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion)
 
     except Exception as e:
-        raise HTTPException(status_code = 500, detail =  str(e))
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+@app.post("/weightest2/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest2(request_body: WeightEst2):
 
-@app.post("/weightest2/")
-def weightest2(request_body: WeightEst2, response: Response):
+    if metrics.enabled:
+        metrics.observeValidation()
 
     try: 
-        Z, SEPZ, CI, PIL, PIU, warningMessage = weightEst2(
+        Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion = await getDispatchedWeightingResult(
+            weightEst2,
             request_body.x1,
             request_body.x2,
             request_body.sep1,
@@ -215,25 +572,22 @@ def weightest2(request_body: WeightEst2, response: Response):
             request_body.code1,
             request_body.code2
         )
-        if warningMessage is not None:
-            response.headers["X-USGSWIM-Messages"] = json.dumps({'warning': warningMessage})
-        response.headers["Access-Control-Expose-Headers"] = "X-USGSWIM-Messages"
-        return {
-            "Z": Z,
-            "SEPZ": SEPZ,
-            "CI": CI,
-            "PIL": PIL,
-            "PIU": PIU
-        }
+        return getWeightingResponse(Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion)
 
     except Exception as e:
-        raise HTTPException(status_code = 500, detail =  str(e))
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
 
-@app.post("/weightest3/")
-def weightest3(request_body: WeightEst3, response: Response):
+@app.post("/weightest3/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest3(request_body: WeightEst3):
+
+    if metrics.enabled:
+        metrics.observeValidation()
 
     try:
-        Z, SEPZ, CI, PIL, PIU, warningMessage = weightEst3(
+        Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion = await getDispatchedWeightingResult(
+            weightEst3,
             request_body.x1,
             request_body.x2,
             request_body.x3,
@@ -245,26 +599,23 @@ def weightest3(request_body: WeightEst3, response: Response):
             request_body.code2,
             request_body.code3
         )
-        if warningMessage is not None:
-            response.headers["X-USGSWIM-Messages"] = json.dumps({'warning': warningMessage})
-        response.headers["Access-Control-Expose-Headers"] = "X-USGSWIM-Messages"
-        return {
-            "Z": Z,
-            "SEPZ": SEPZ,
-            "CI": CI,
-            "PIL": PIL,
-            "PIU": PIU
-        }
+        return getWeightingResponse(Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion)
 
     except Exception as e:
-        raise HTTPException(status_code = 500, detail =  str(e))
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
 
 
-@app.post("/weightest4/")
-def weightest4(request_body: WeightEst4, response: Response):
+@app.post("/weightest4/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest4(request_body: WeightEst4, useAllMethods: bool = Query(default=False, title="Use All Methods", description="Weight all 4 estimation methods instead of leaving out the method with the highest SEP")):
+
+    if metrics.enabled:
+        metrics.observeValidation()
 
     try:
-        Z, SEPZ, CI, PIL, PIU, warningMessage = weightEst4(
+        Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion = await getDispatchedWeightingResult(
+            weightEst4,
             request_body.x1,
             request_body.x2,
             request_body.x3,
@@ -278,17 +629,343 @@ def weightest4(request_body: WeightEst4, response: Response):
             request_body.code2,
             request_body.code3,
             request_body.code4,
+            useAllMethods
         )
-        if warningMessage is not None:
-            response.headers["X-USGSWIM-Messages"] = json.dumps({'warning': warningMessage})
-        response.headers["Access-Control-Expose-Headers"] = "X-USGSWIM-Messages"
-        return {
+        return getWeightingResponse(Z, SEPZ, CI, PIL, PIU, warningMessage, tableVersion)
+
+    except Exception as e:
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+# Cacheable GET versions of the weighting endpoints, with the same fields as query parameters
+@app.get("/weightest/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightestGet(request: Request, query: WeightEst = Depends()):
+
+    return getCacheableWeightingResponse(
+        request,
+        weightEst,
+        query.x1,
+        query.x2,
+        query.x3,
+        query.x4,
+        query.sep1,
+        query.sep2,
+        query.sep3,
+        query.sep4,
+        query.regressionRegionCode,
+        query.code1,
+        query.code2,
+        query.code3,
+        query.code4,
+    )
+
+@app.get("/weightest2/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest2Get(request: Request, query: WeightEst2 = Depends()):
+
+    return getCacheableWeightingResponse(
+        request,
+        weightEst2,
+        query.x1,
+        query.x2,
+        query.sep1,
+        query.sep2,
+        query.regressionRegionCode,
+        query.code1,
+        query.code2
+    )
+
+@app.get("/weightest3/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest3Get(request: Request, query: WeightEst3 = Depends()):
+
+    return getCacheableWeightingResponse(
+        request,
+        weightEst3,
+        query.x1,
+        query.x2,
+        query.x3,
+        query.sep1,
+        query.sep2,
+        query.sep3,
+        query.regressionRegionCode,
+        query.code1,
+        query.code2,
+        query.code3
+    )
+
+@app.get("/weightest4/", response_model=getResponseModel(WeightEstResult), response_class=WeightingResponse)
+async def weightest4Get(request: Request, query: WeightEst4 = Depends(), useAllMethods: bool = Query(default=False, title="Use All Methods", description="Weight all 4 estimation methods instead of leaving out the method with the highest SEP")):
+
+    return getCacheableWeightingResponse(
+        request,
+        weightEst4,
+        query.x1,
+        query.x2,
+        query.x3,
+        query.x4,
+        query.sep1,
+        query.sep2,
+        query.sep3,
+        query.sep4,
+        query.regressionRegionCode,
+        query.code1,
+        query.code2,
+        query.code3,
+        query.code4,
+        useAllMethods
+    )
+
+def getBatchResponseContent(results):
+    return [
+        {
             "Z": Z,
             "SEPZ": SEPZ,
             "CI": CI,
             "PIL": PIL,
-            "PIU": PIU
+            "PIU": PIU,
+            "warning": warningMessage,
+            "error": errorMessage,
+            "errorId": errorId
         }
+        for Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId in results
+    ]
+
+# Batch records are validated one at a time, so a record that is not a valid WeightEst fails only its own slot
+#  With settings.LEAN_VALIDATION, records are decoded without constructing a pydantic model; the errors are the same
+decodeBatchRecord = compileRecordDecoder(WeightEst) if settings.LEAN_VALIDATION else None
+
+# Returns the weightEst arguments of a batch record and None, or None and the message of its validation errors, ex. "x1: value is not a valid float"
+def getBatchRecordRow(record):
+    if decodeBatchRecord is not None and record.__class__ is dict:
+        errors = []
+        record = decodeBatchRecord(record, (), errors)
+        if record is None:
+            return None, getValidationMessage(ValidationError(errors, WeightEst).errors())
+    else:
+        try:
+            record = WeightEst.parse_obj(record)
+        except ValidationError as e:
+            return None, getValidationMessage(e.errors())
+    return (
+        record.x1,
+        record.x2,
+        record.x3,
+        record.x4,
+        record.sep1,
+        record.sep2,
+        record.sep3,
+        record.sep4,
+        record.regressionRegionCode,
+        record.code1,
+        record.code2,
+        record.code3,
+        record.code4,
+    ), None
+
+def getValidationMessage(errors):
+    return "; ".join(
+        error["msg"] if error["loc"] in ((), ("__root__",)) else ".".join(str(loc) for loc in error["loc"]) + ": " + error["msg"]
+        for error in errors
+    )
+
+# Weights the valid rows of a batch and returns the results of every record in order, with the results of the invalid records, keyed by their index, in their slots
+def getBatchResults(rows, invalidResults, coefficientTables):
+    results = iter(weightEstBatch(rows, coefficientTables))
+    return [invalidResults[index] if index in invalidResults else next(results) for index in range(len(rows) + len(invalidResults))]
+
+# Weights a batch and serializes the response body, for batches weighted in the threadpool
+def getBatchResponseBody(rows, invalidResults, coefficientTables):
+    return WeightingResponse(getBatchResponseContent(getBatchResults(rows, invalidResults, coefficientTables))).body
+
+# The body is read as raw records, documented as WeightEst records, so that each one can be validated on its own
+@app.post("/weightest/batch", response_model=getResponseModel(List[WeightEstBatchResult]), response_class=WeightingResponse, openapi_extra={
+    "requestBody": {"content": {"application/json": {"schema": {"items": {"$ref": "#/components/schemas/WeightEst"}}}}}
+})
+async def weightestbatch(request_body: List[Any]):
+
+    # Each record is weighted independently; a record that fails, including one that is not a valid WeightEst, reports its error without failing the whole batch
+    try:
+        coefficientTables = getCoefficientTables()
+        rows = []
+        invalidResults = {}
+        for index, record in enumerate(request_body):
+            row, errorMessage = getBatchRecordRow(record)
+            if row is None:
+                invalidResults[index] = (None, None, None, None, None, None, errorMessage, WeightingError.errorId)
+                if metrics.enabled:
+                    metrics.countError(WeightingError)
+            else:
+                rows.append(row)
+
+        if metrics.enabled:
+            metrics.observeValidation()
+
+        headers = {"Access-Control-Expose-Headers": exposeHeaders, "X-USGSWIM-Table-Version": coefficientTables.version}
+        # The weighting math takes microseconds per record, so only large batches are worth handing off to the threadpool
+        if settings.BATCH_OFFLOAD_THRESHOLD > 0 and len(request_body) >= settings.BATCH_OFFLOAD_THRESHOLD:
+            key = ("/weightest/batch", tuple(rows), tuple(invalidResults.items()), coefficientTables)
+            body = await runCoalesced(key, getBatchResponseBody, rows, invalidResults, coefficientTables)
+            return Response(body, media_type=WeightingResponse.media_type, headers=headers)
+        return WeightingResponse(getBatchResponseContent(getBatchResults(rows, invalidResults, coefficientTables)), headers=headers)
+
+    except Exception as e:
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+# Weights the estimates of one site at every AEP, Q66.7 through Q0.2, and returns the whole weighted frequency curve
+@app.post("/weightest/curve", response_model=getResponseModel(List[WeightEstCurveResult]), response_class=WeightingResponse)
+async def weightestCurve(request_body: WeightEstCurve, useAllMethods: bool = Query(default=False, title="Use All Methods", description="Weight all 4 estimation methods instead of leaving out the method with the highest SEP at each AEP")):
+
+    if metrics.enabled:
+        metrics.observeValidation()
+
+    try:
+        coefficientTables = getCoefficientTables()
+        results = weightEstCurve(
+            [estimate.method for estimate in request_body.estimates],
+            [estimate.x for estimate in request_body.estimates],
+            [estimate.sep for estimate in request_body.estimates],
+            request_body.regressionRegionCode,
+            useAllMethods,
+            coefficientTables
+        )
+        return WeightingResponse([
+            {
+                "AEP": AEP,
+                "Z": Z,
+                "SEPZ": SEPZ,
+                "CI": CI,
+                "PIL": PIL,
+                "PIU": PIU,
+                "warning": warningMessage
+            }
+            for AEP, Z, SEPZ, CI, PIL, PIU, warningMessage in results
+        ], headers={"Access-Control-Expose-Headers": exposeHeaders, "X-USGSWIM-Table-Version": coefficientTables.version})
+
+    except Exception as e:
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+# Runs weightEstSensitivity and returns the serialized response body and the warning message
+def getSensitivityResponseBody(*arguments):
+    (Z, SEPZ, CI, PIL, PIU, warningMessage), summaries = weightEstSensitivity(*arguments)
+    return WeightingResponse({
+        "Z": Z,
+        "SEPZ": SEPZ,
+        "CI": CI,
+        "PIL": PIL,
+        "PIU": PIU,
+        "samples": arguments[6],
+        "quantiles": list(arguments[7]),
+        "summaries": {name: {"mean": mean, "quantiles": values} for name, (mean, values) in summaries.items()},
+    }).body, warningMessage
+
+# Samples perturbations of the estimates and SEPs of one site and returns the unperturbed result with the mean and quantiles of the sampled results
+@app.post("/weightest/sensitivity", response_model=getResponseModel(WeightEstSensitivityResult), response_class=WeightingResponse)
+async def weightestSensitivity(request_body: WeightEstSensitivity, useAllMethods: bool = Query(default=False, title="Use All Methods", description="Weight all 4 estimation methods instead of leaving out the method with the highest SEP")):
+
+    if metrics.enabled:
+        metrics.observeValidation()
+
+    try:
+        coefficientTables = getCoefficientTables()
+        arguments = (
+            [request_body.x1, request_body.x2, request_body.x3, request_body.x4],
+            [request_body.sep1, request_body.sep2, request_body.sep3, request_body.sep4],
+            request_body.regressionRegionCode,
+            [request_body.code1, request_body.code2, request_body.code3, request_body.code4],
+            [request_body.xSigma1, request_body.xSigma2, request_body.xSigma3, request_body.xSigma4],
+            [request_body.sepSigma1, request_body.sepSigma2, request_body.sepSigma3, request_body.sepSigma4],
+            request_body.samples,
+            request_body.quantiles,
+            useAllMethods,
+            request_body.seed,
+            coefficientTables
+        )
+        # Large sample counts take long enough to block the event loop, so they are weighted in the threadpool like large batches
+        if settings.BATCH_OFFLOAD_THRESHOLD > 0 and request_body.samples >= settings.BATCH_OFFLOAD_THRESHOLD:
+            # Identical requests without a seed that are coalesced share one set of samples
+            key = ("/weightest/sensitivity",) + tuple(tuple(argument) if isinstance(argument, list) else argument for argument in arguments)
+            body, warningMessage = await runCoalesced(key, getSensitivityResponseBody, *arguments)
+        else:
+            body, warningMessage = getSensitivityResponseBody(*arguments)
+        headers = {"Access-Control-Expose-Headers": exposeHeaders, "X-USGSWIM-Table-Version": coefficientTables.version}
+        if warningMessage is not None:
+            headers["X-USGSWIM-Messages"] = getMessagesHeader(warningMessage)
+        return Response(body, media_type=WeightingResponse.media_type, headers=headers)
+
+    except Exception as e:
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+# Weights an NDJSON (application/x-ndjson) or CSV (text/csv) request body in chunks of settings.STREAM_CHUNK_SIZE rows and streams back one result per row, in the same format
+#  Rows have the same fields as the weightest request body, and any other fields are copied to the output
+#  bulk_weighting is imported when the route is first requested, so it and csv are not loaded at startup
+@app.post("/weightest/stream", response_class=BodyStreamingResponse, openapi_extra=getRawRequestBodyDocs("bulk_weighting", {"type": "string"}))
+async def weightestStream(request: Request):
+    from bulk_weighting import BulkWeighter, getFormat, iterateLines, mediaTypes
+
+    format = getFormat(request.headers.get("content-type"))
+    weighter = BulkWeighter(format)
+
+    async def streamResults():
+        async for line in iterateLines(request.stream()):
+            for outputLine in weighter.feed(line):
+                yield outputLine
+        for outputLine in weighter.finish():
+            yield outputLine
+
+    return BodyStreamingResponse(streamResults(), media_type=mediaTypes[format], headers={"Access-Control-Expose-Headers": exposeHeaders, "X-USGSWIM-Table-Version": weighter.coefficientTables.version})
+
+# Weights an Arrow IPC stream (application/vnd.apache.arrow.stream), Arrow IPC file (application/vnd.apache.arrow.file), or Parquet (application/vnd.apache.parquet) request body
+#  and returns the table with Z, SEPZ, CI, PIL, PIU, warning, and error columns added, in the same format
+#  Columns have the same names as the weightest request body fields, and any other columns are kept; pyarrow must be installed
+#  columnar_weighting is imported when the route is first requested, like bulk_weighting
+@app.post("/weightest/columnar", response_class=Response, openapi_extra=getRawRequestBodyDocs("columnar_weighting", {"type": "string", "format": "binary"}))
+async def weightestColumnar(request: Request):
+    import columnar_weighting
+
+    try:
+        format = columnar_weighting.getFormat(request.headers.get("content-type"))
+        coefficientTables = getCoefficientTables()
+        body = await request.body()
+        # Files are expected to be large, so they are always weighted in the threadpool
+        content = await runCoalesced(("/weightest/columnar", format, body, coefficientTables), columnar_weighting.weightEstColumnar, body, format, 1, coefficientTables)
+        return Response(content, media_type=columnar_weighting.mediaTypes[format], headers={"Access-Control-Expose-Headers": exposeHeaders, "X-USGSWIM-Table-Version": coefficientTables.version})
 
     except Exception as e:
-        raise HTTPException(status_code = 500, detail =  str(e))
+        if metrics.enabled:
+            metrics.countError(e)
+        raise getErrorException(e)
+
+# Prometheus metrics, only available when settings.METRICS_ENABLED is set
+if metrics.enabled:
+    @app.get("/metrics", include_in_schema=False)
+    def getMetrics():
+        cacheInfo = getCorrelationCacheInfo()
+        if resultCache is not None:
+            cacheInfo["result"] = resultCache.info()
+        return PlainTextResponse(metrics.renderMetrics(cacheInfo, getCoefficientTables().version, singleFlight.coalesced if singleFlight is not None else None), media_type="text/plain; version=0.0.4")
+
+# Checks for a replaced coefficient store every settings.TABLES_RELOAD_INTERVAL seconds and swaps in the new tables
+#  Requests already in progress finish with the tables they started with; a store that cannot be loaded is logged and the current tables are kept
+async def reloadTablesPeriodically():
+    while True:
+        await asyncio.sleep(settings.TABLES_RELOAD_INTERVAL)
+        try:
+            reloaded = reloadCoefficientTables()
+        except Exception:
+            logging.getLogger(__name__).exception("Could not reload the coefficient store " + settings.COEFFICIENT_STORE_PATH)
+            if metrics.enabled:
+                metrics.countTableReload("error")
+            continue
+        if reloaded and metrics.enabled:
+            metrics.countTableReload("success")
+
+if settings.TABLES_RELOAD_INTERVAL > 0 and settings.COEFFICIENT_STORE_PATH:
+    @app.on_event("startup")
+    async def startTableReloads():
+        asyncio.get_running_loop().create_task(reloadTablesPeriodically())
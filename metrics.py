@@ -0,0 +1,155 @@
+import contextvars
+from time import perf_counter
+
+import settings
+from weighting_errors import errorTypes
+
+######
+##
+## Metrics
+##
+######
+
+# Optional instrumentation of the weighting service (settings.METRICS_ENABLED), exposed at /metrics in the Prometheus text exposition format
+#  Instrumented code checks metrics.enabled before taking any timings, so there is no other overhead when metrics are disabled
+
+enabled = settings.METRICS_ENABLED
+
+# Error messages of the weighting error types, grouped into error classes by their errorId, for errors that are only known by their message
+errorClasses = {errorType.message: errorType.errorId for errorType in errorTypes}
+
+requestCounts = {} # (route, status) -> count
+stageTimes = {} # stage -> [count, total seconds]
+errorCounts = {} # error class -> count
+outsideRangeCount = [0]
+tableReloadCounts = {} # result -> count
+
+# Time the current request started, set by MetricsMiddleware
+requestStart = contextvars.ContextVar("requestStart", default=None)
+
+def observeStage(stage, seconds):
+    stageTime = stageTimes.get(stage)
+    if stageTime is None:
+        stageTime = stageTimes[stage] = [0, 0.0]
+    stageTime[0] += 1
+    stageTime[1] += seconds
+
+# Records the time from the start of the request until the endpoint is called, which is spent reading, parsing, and validating the request body
+def observeValidation():
+    start = requestStart.get()
+    if start is not None:
+        observeStage("validation", perf_counter() - start)
+
+def countError(error, count = 1):
+    #error is a weighting error, a weighting error type, or any other exception or error message, which is counted by its message
+    errorClass = getattr(error, "errorId", None) or errorClasses.get(str(error), "other")
+    errorCounts[errorClass] = errorCounts.get(errorClass, 0) + count
+
+def countOutsideRange(count = 1):
+    outsideRangeCount[0] += count
+
+def countTableReload(result):
+    tableReloadCounts[result] = tableReloadCounts.get(result, 0) + 1
+
+# ASGI middleware that counts requests per route and status and times each whole request
+class MetricsMiddleware:
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        token = requestStart.set(start)
+        status = [500]
+
+        async def sendWithStatus(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, sendWithStatus)
+        finally:
+            requestStart.reset(token)
+            observeStage("request", perf_counter() - start)
+            # Paths that did not match a route are counted together so that they cannot add new series
+            route = scope["path"] if status[0] != 404 else "unmatched"
+            key = (route, status[0])
+            requestCounts[key] = requestCounts.get(key, 0) + 1
+
+def formatLabels(**labels):
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in labels.items()) + "}"
+
+# Renders all metrics in the Prometheus text exposition format
+def renderMetrics(cacheInfo = None, tableVersion = None, coalescedCount = None):
+    #cacheInfo is an optional dict of cache name -> functools cache_info() dict to include
+    #tableVersion is the version of the coefficient tables in use
+    #coalescedCount is the number of requests that shared the computation of an identical request, when coalescing is enabled
+    lines = [
+        "# HELP weighting_requests_total Requests handled, per route and status code.",
+        "# TYPE weighting_requests_total counter",
+    ]
+    for (route, status), count in sorted(requestCounts.items()):
+        lines.append("weighting_requests_total" + formatLabels(route=route, status=status) + " " + str(count))
+
+    lines += [
+        "# HELP weighting_stage_seconds Time spent in each stage of handling a request.",
+        "# TYPE weighting_stage_seconds summary",
+    ]
+    for stage, (count, seconds) in sorted(stageTimes.items()):
+        lines.append("weighting_stage_seconds_sum" + formatLabels(stage=stage) + " " + repr(seconds))
+        lines.append("weighting_stage_seconds_count" + formatLabels(stage=stage) + " " + str(count))
+
+    lines += [
+        "# HELP weighting_errors_total Inputs that could not be weighted, per error class.",
+        "# TYPE weighting_errors_total counter",
+    ]
+    for errorClass, count in sorted(errorCounts.items()):
+        lines.append("weighting_errors_total" + formatLabels(error=errorClass) + " " + str(count))
+
+    lines += [
+        "# HELP weighting_results_outside_range_total Weighted estimates outside the range of the input values.",
+        "# TYPE weighting_results_outside_range_total counter",
+        "weighting_results_outside_range_total " + str(outsideRangeCount[0]),
+    ]
+
+    if coalescedCount is not None:
+        lines += [
+            "# HELP weighting_requests_coalesced_total Requests that shared the computation of an identical request in progress.",
+            "# TYPE weighting_requests_coalesced_total counter",
+            "weighting_requests_coalesced_total " + str(coalescedCount),
+        ]
+
+    if tableVersion is not None:
+        lines += [
+            "# HELP weighting_table_info Version of the coefficient tables in use.",
+            "# TYPE weighting_table_info gauge",
+            "weighting_table_info" + formatLabels(version=tableVersion) + " 1",
+        ]
+    lines += [
+        "# HELP weighting_table_reloads_total Attempts to load a replaced coefficient store, per result.",
+        "# TYPE weighting_table_reloads_total counter",
+    ]
+    for result, count in sorted(tableReloadCounts.items()):
+        lines.append("weighting_table_reloads_total" + formatLabels(result=result) + " " + str(count))
+
+    if cacheInfo:
+        for suffix, field in (("hits", "hits"), ("misses", "misses")):
+            lines += [
+                "# HELP weighting_cache_{0}_total Cache {0}, per cache.".format(suffix),
+                "# TYPE weighting_cache_{}_total counter".format(suffix),
+            ]
+            for name, info in sorted(cacheInfo.items()):
+                lines.append("weighting_cache_{}_total".format(suffix) + formatLabels(cache=name) + " " + str(info[field]))
+        lines += [
+            "# HELP weighting_cache_size Entries in each cache.",
+            "# TYPE weighting_cache_size gauge",
+        ]
+        for name, info in sorted(cacheInfo.items()):
+            lines.append("weighting_cache_size" + formatLabels(cache=name) + " " + str(info["currsize"]))
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,89 @@
+import asyncio
+from time import perf_counter
+
+import metrics
+from ChannelWidthWeighting import getBatchRowValues, weightBatchGroups
+from weighting_errors import NonFiniteResultError, NotPositiveDefiniteError
+
+######
+##
+## Micro-batching of single-site requests
+##
+######
+
+# Gathers the single-site requests that arrive within a short window into one vectorized weighting call (settings.MICROBATCH_WINDOW, settings.MICROBATCH_SIZE)
+#  Each row is checked when it is submitted, so invalid inputs fail right away with the same errors as the single-site functions, and only valid rows wait for the batch
+#  The batch is weighted when the window after its first row ends or when it reaches the maximum size, whichever comes first
+#  Rows are grouped by the coefficient tables they were submitted with, so a table swap during a window does not mix tables in one call
+
+# Errors that only show up when rows are weighted, by errorId
+weightingErrors = {errorType.errorId: errorType for errorType in (NotPositiveDefiniteError, NonFiniteResultError)}
+
+class MicroBatcher:
+
+    def __init__(self, window, maxSize):
+        #window is the number of seconds to wait for more rows after the first row of a batch
+        #maxSize is the number of rows that are weighted at once without waiting for the rest of the window
+        self.window = window
+        self.maxSize = maxSize
+        self.pending = [] # (rowValues, coefficientTables, future)
+        self.timer = None
+        self.batches = 0
+        self.rows = 0
+
+    # Weights one row of weightEst arguments and returns its (Z, SEPZ, CI, PIL, PIU, warningMessage)
+    async def weight(self, row, coefficientTables):
+        #row is a sequence of the weightEst arguments, in order: x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4
+        rowValues = getBatchRowValues(row, coefficientTables)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((rowValues, coefficientTables, future))
+        if len(self.pending) >= self.maxSize:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+
+        Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId = await future
+        #Rows were checked when they were submitted, so the only errors left are a covariance matrix that is not positive definite and results that overflow
+        if errorMessage is not None:
+            raise weightingErrors[errorId](errorMessage)
+        return Z, SEPZ, CI, PIL, PIU, warningMessage
+
+    # Weights the pending rows and completes their futures
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        pending = self.pending
+        self.pending = []
+        if not pending:
+            return
+
+        if metrics.enabled:
+            mathStart = perf_counter()
+
+        tableGroups = {}
+        for item in pending:
+            tableGroups.setdefault(item[1], []).append(item)
+        for items in tableGroups.values():
+            results = [None] * len(items)
+            groups = {2: [], 3: []}
+            for index, (rowValues, coefficientTables, future) in enumerate(items):
+                groups[len(rowValues[0])].append((index,) + rowValues)
+            try:
+                weightBatchGroups(groups, results)
+            except Exception as e:
+                for rowValues, coefficientTables, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (rowValues, coefficientTables, future), result in zip(items, results):
+                # Callers that were cancelled while waiting no longer need their result
+                if not future.done():
+                    future.set_result(result)
+
+        self.batches += 1
+        self.rows += len(pending)
+        if metrics.enabled:
+            metrics.observeStage("math", perf_counter() - mathStart)
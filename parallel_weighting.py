@@ -0,0 +1,172 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from ChannelWidthWeighting import droppedMethodWarning, outsideRangeWarning, weightEstBatch
+
+######
+##
+## Parallel weighting of very large batches
+##
+######
+
+# Weights millions of rows by splitting them into chunks that are weighted with weightEstBatch in a pool of worker processes
+#  Inputs and results are columns of NumPy arrays in shared memory, so each worker reads its rows and writes its results in place and no rows are pickled;
+#   each worker decodes its chunk into Python rows for weightEstBatch, so weighting still builds Python values per row
+#  Region and statistic codes are stored as integer ids into lists of the distinct codes, which are sent to each worker once
+#  Missing estimates and SEPs are marked in their own boolean column, so a NaN estimate or SEP is weighted as the value it is and fails its row as weightEstBatch does
+#  Only the error messages and error ids of rows that could not be weighted are sent back from the workers
+# Results are in the same order as the input rows
+
+# Bits of the warning flags column
+outsideRangeFlag = 1
+droppedMethodFlag = 2
+
+# Converts weightEst argument rows into columns
+def encodeRows(rows):
+    #rows is a list of sequences of the weightEst arguments, in order: x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4
+    #Returns x and SEP (M, 4) float arrays, a (M, 8) bool array of which of x1-x4 and SEP1-SEP4 are missing, region ids (M,) and code ids (M, 4) int arrays with -1 for missing codes, and the lists of region and statistic codes the ids point to
+    xArray = np.array([row[0:4] for row in rows], dtype=float).reshape(len(rows), 4)
+    SEPArray = np.array([row[4:8] for row in rows], dtype=float).reshape(len(rows), 4)
+    missingArray = np.array([[value is None for value in row[0:8]] for row in rows], dtype=bool).reshape(len(rows), 8)
+
+    regionCodes = {}
+    regionIds = np.array([regionCodes.setdefault(row[8], len(regionCodes)) for row in rows], dtype=np.int32)
+    statisticCodes = {None: -1}
+    codeIds = np.array([[statisticCodes.setdefault(code, len(statisticCodes) - 1) for code in row[9:13]] for row in rows], dtype=np.int32).reshape(len(rows), 4)
+    del statisticCodes[None]
+
+    return xArray, SEPArray, missingArray, regionIds, codeIds, list(regionCodes), list(statisticCodes)
+
+# Weights rows start to end of the columns and writes the results into the result columns
+#  Returns a dict of row index -> (error message, errorId) for the rows that could not be weighted
+def weightColumnRange(columns, regionCodes, statisticCodes, start, end, coefficientTables = None):
+    xArray, SEPArray, missingArray, regionIds, codeIds, resultArray, warningFlags = columns
+
+    #Decode the rows a whole chunk at a time into lists of Python values for weightEstBatch: missing values become None, and ids are looked up in object arrays whose last element, id -1, is None
+    valueObjects = np.concatenate((xArray[start:end], SEPArray[start:end]), axis=1).astype(object)
+    valueObjects[missingArray[start:end]] = None
+    regionObjects = np.array(regionCodes + [None], dtype=object)[regionIds[start:end]]
+    codeObjects = np.array(statisticCodes + [None], dtype=object)[codeIds[start:end]]
+    rows = np.concatenate((valueObjects, regionObjects[:, None], codeObjects), axis=1).tolist()
+
+    errors = {}
+    results = []
+    flags = []
+    missingResult = (math.nan,) * 5
+    for index, (Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId) in enumerate(weightEstBatch(rows, coefficientTables), start):
+        if errorMessage is not None:
+            errors[index] = (errorMessage, errorId)
+            results.append(missingResult)
+            flags.append(0)
+            continue
+        results.append((Z, SEPZ, CI, PIL, PIU))
+        if warningMessage is None:
+            flags.append(0)
+        else:
+            flags.append((outsideRangeFlag if outsideRangeWarning in warningMessage else 0) | (droppedMethodFlag if droppedMethodWarning in warningMessage else 0))
+    if results:
+        resultArray[start:end] = results
+        warningFlags[start:end] = flags
+    return errors
+
+######
+##
+## Shared memory and worker processes
+##
+######
+
+# Columns attached to the shared memory blocks in each worker process
+workerColumns = None
+workerCodes = None
+workerBlocks = []
+
+# Creates a NumPy array in a new shared memory block, filled with fillValue
+def createSharedArray(shape, dtype, fillValue):
+    block = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize))
+    array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    array.fill(fillValue)
+    return block, array
+
+def attachColumns(columnSpecs, regionCodes, statisticCodes):
+    #columnSpecs is a list of (shared memory name, shape, dtype) for each column
+    global workerColumns, workerCodes
+    columns = []
+    for name, shape, dtype in columnSpecs:
+        block = shared_memory.SharedMemory(name=name)
+        workerBlocks.append(block)
+        columns.append(np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    workerColumns = columns
+    workerCodes = (regionCodes, statisticCodes)
+
+def weightWorkerRange(start, end):
+    return weightColumnRange(workerColumns, *workerCodes, start, end)
+
+# Number of worker processes to use by default: one per core this process can run on
+def getDefaultProcesses():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Weights encoded columns in a pool of processes and returns a (M, 5) array of Z, SEPZ, CI, PIL, PIU, the (M,) warning flags, and a dict of row index -> (error message, errorId)
+#  Rows that could not be weighted are NaN in the result array
+def weightColumnsParallel(xArray, SEPArray, missingArray, regionIds, codeIds, regionCodes, statisticCodes, processes = None, chunkSize = None):
+    #processes is the number of worker processes; by default one per available core
+    #chunkSize is the number of rows each task weights; by default the rows are split into 4 chunks per process
+    numberRows = len(xArray)
+    processes = processes or getDefaultProcesses()
+    chunkSize = chunkSize or max(1000, math.ceil(numberRows / (processes * 4)))
+    chunks = [(start, min(start + chunkSize, numberRows)) for start in range(0, numberRows, chunkSize)]
+
+    #Input columns, then the result array and warning flags
+    columnValues = ((xArray, np.nan), (SEPArray, np.nan), (missingArray, True), (regionIds, -1), (codeIds, -1), (np.empty((numberRows, 5)), np.nan), (np.empty(numberRows, dtype=np.int8), 0))
+    numberInputColumns = 5
+    blocks = []
+    columns = []
+    try:
+        for array, fillValue in columnValues:
+            block, sharedArray = createSharedArray(array.shape, array.dtype, fillValue)
+            blocks.append(block)
+            columns.append(sharedArray)
+            if len(columns) <= numberInputColumns:
+                sharedArray[...] = array
+        del sharedArray
+
+        errors = {}
+        if processes == 1 or len(chunks) <= 1:
+            for start, end in chunks:
+                errors.update(weightColumnRange(columns, regionCodes, statisticCodes, start, end))
+        else:
+            columnSpecs = [(block.name, array.shape, array.dtype.str) for block, array in zip(blocks, columns)]
+            with ProcessPoolExecutor(max_workers=min(processes, len(chunks)), initializer=attachColumns, initargs=(columnSpecs, regionCodes, statisticCodes)) as executor:
+                for chunkErrors in executor.map(weightWorkerRange, *zip(*chunks)):
+                    errors.update(chunkErrors)
+
+        #Copy the results out of shared memory before it is released
+        return columns[5].copy(), columns[6].copy(), errors
+    finally:
+        #The arrays must be released before the blocks they point to can be closed
+        columns.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+# Same results as weightEstBatch, weighted in a pool of processes
+def weightEstParallel(rows, processes = None, chunkSize = None):
+    #rows is a list of sequences of the weightEst arguments, in order: x1, x2, x3, x4, SEP1, SEP2, SEP3, SEP4, regressionRegionCode, code1, code2, code3, code4
+    #Returns a list, in the same order as rows, of (Z, SEPZ, CI, PIL, PIU, warningMessage, errorMessage, errorId) tuples
+    resultArray, warningFlags, errors = weightColumnsParallel(*encodeRows(rows), processes, chunkSize)
+
+    results = []
+    for index, (values, flags) in enumerate(zip(resultArray.tolist(), warningFlags.tolist())):
+        if index in errors:
+            results.append((None, None, None, None, None, None) + errors[index])
+            continue
+        warningMessage = None
+        if flags:
+            warningMessage = (outsideRangeWarning if flags & outsideRangeFlag else "") + (droppedMethodWarning if flags & droppedMethodFlag else "")
+        results.append(tuple(values) + (warningMessage, None, None))
+    return results
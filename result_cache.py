@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+######
+##
+## Result cache
+##
+######
+
+# In-process cache of weighting results keyed on the function and its normalized arguments, with LRU eviction and an optional time to live
+#  Only results are cached; calls that raise are not, so invalid inputs are checked again every time
+
+class ResultCache:
+
+    def __init__(self, maxSize, ttl = 0):
+        #maxSize is the number of results kept before the least recently used result is evicted
+        #ttl is the number of seconds a result is kept, or 0 to keep results until they are evicted
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.entries = OrderedDict() # key -> (time stored, result)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if not self.ttl or monotonic() - entry[0] < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self.lock:
+            self.entries[key] = (monotonic(), result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+    # Returns function(*arguments), computing it only if the result is not already cached
+    def call(self, function, arguments):
+        key = (function.__name__,) + tuple(arguments)
+        result = self.get(key)
+        if result is None:
+            result = function(*arguments)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # Same fields as functools cache_info()
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "maxsize": self.maxSize, "currsize": len(self.entries)}
@@ -0,0 +1,160 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import time
+
+import uvicorn
+
+import settings
+
+######
+##
+## Pre-fork production launcher
+##
+######
+
+# Runs the service in settings.SERVE_WORKERS uvicorn worker processes that share one listening socket (POSIX only)
+#  The parent imports main.py, loads the coefficient tables and any precomputed weights, builds the OpenAPI schema, and freezes the garbage collector before forking
+#  so that every worker shares those pages copy-on-write instead of importing and building them again
+# Signals sent to the parent:
+#  SIGHUP reloads the coefficient store and replaces the workers one at a time, starting each new worker before stopping an old one
+#  SIGTERM and SIGINT stop the workers, which finish the requests in progress, and then the parent
+# Workers that exit unexpectedly are replaced
+# Code changes need a restart of the parent, since workers run the code the parent loaded
+
+logger = logging.getLogger("uvicorn.error")
+
+# Number of workers to run by default: one per core this process can run on
+def getDefaultWorkers():
+    if settings.SERVE_WORKERS > 0:
+        return settings.SERVE_WORKERS
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+class WorkerPool:
+
+    def __init__(self, config, numberWorkers, stopTimeout):
+        #config is the uvicorn.Config of the workers, already loaded
+        #stopTimeout is the number of seconds a worker has to finish its requests before it is killed
+        self.config = config
+        self.numberWorkers = numberWorkers
+        self.stopTimeout = stopTimeout
+        self.socket = config.bind_socket()
+        self.workers = set() # pids
+        self.signals = []
+
+    def spawnWorker(self):
+        #Objects the parent created since the last fork are frozen as well, so the new worker shares them too
+        gc.freeze()
+        pid = os.fork()
+        if pid != 0:
+            self.workers.add(pid)
+            return pid
+
+        #Worker process: uvicorn installs its own SIGINT and SIGTERM handlers
+        try:
+            for signalNumber in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+                signal.signal(signalNumber, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            uvicorn.Server(self.config).run(sockets=[self.socket])
+        except BaseException:
+            logger.exception("Worker %s stopped with an error", os.getpid())
+            os._exit(1)
+        os._exit(0)
+
+    # Asks a worker to stop and waits for it to finish its requests, killing it after stopTimeout
+    def stopWorker(self, pid):
+        self.workers.discard(pid)
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + self.stopTimeout
+        while time.monotonic() < deadline:
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                return
+            time.sleep(0.1)
+        logger.warning("Worker %s did not stop within %s seconds and was killed", pid, self.stopTimeout)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+    # Reaps workers that have exited and starts replacements
+    def replaceExitedWorkers(self):
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            if pid in self.workers:
+                self.workers.discard(pid)
+                logger.warning("Worker %s exited with status %s and is being replaced", pid, status)
+                self.spawnWorker()
+
+    def rollingRestart(self):
+        import ChannelWidthWeighting
+        try:
+            if ChannelWidthWeighting.reloadCoefficientTables() and ChannelWidthWeighting.precomputeWeights:
+                ChannelWidthWeighting.getWeightTable(ChannelWidthWeighting.getCoefficientTables())
+        except Exception:
+            logger.exception("Could not reload the coefficient store " + settings.COEFFICIENT_STORE_PATH)
+        for pid in list(self.workers):
+            self.spawnWorker()
+            self.stopWorker(pid)
+        logger.info("Restarted %s workers", len(self.workers))
+
+    def run(self):
+        for signalNumber in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+            signal.signal(signalNumber, lambda signalNumber, frame: self.signals.append(signalNumber))
+
+        for i in range(self.numberWorkers):
+            self.spawnWorker()
+        logger.info("Started %s workers on %s:%s", self.numberWorkers, self.config.host, self.config.port)
+
+        try:
+            while True:
+                while self.signals:
+                    signalNumber = self.signals.pop(0)
+                    if signalNumber == signal.SIGHUP:
+                        self.rollingRestart()
+                    else:
+                        return
+                self.replaceExitedWorkers()
+                time.sleep(0.2)
+        finally:
+            for pid in list(self.workers):
+                os.kill(pid, signal.SIGTERM)
+            for pid in list(self.workers):
+                self.stopWorker(pid)
+            self.socket.close()
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description="Serve the weighting services from pre-forked uvicorn workers that share the preloaded application.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to bind (default %(default)s)")
+    parser.add_argument("--port", type=int, default=8000, help="port to bind (default %(default)s)")
+    parser.add_argument("-w", "--workers", type=int, default=getDefaultWorkers(), help="number of worker processes (default %(default)s, from SERVE_WORKERS or the available cores)")
+    parser.add_argument("--stop-timeout", type=float, default=30, help="seconds a worker has to finish its requests when stopping (default %(default)s)")
+    parser.add_argument("--log-level", default="info", help="uvicorn log level (default %(default)s)")
+    arguments = parser.parse_args(arguments)
+
+    #Preload everything the workers share
+    import main
+    from ChannelWidthWeighting import getCoefficientTables, getWeightTable, precomputeWeights
+    getCoefficientTables()
+    if precomputeWeights:
+        getWeightTable(getCoefficientTables())
+    if main.app.openapi_url:
+        main.app.openapi()
+
+    config = uvicorn.Config(main.app, host=arguments.host, port=arguments.port, log_level=arguments.log_level, lifespan="on")
+    config.load()
+    gc.collect()
+
+    WorkerPool(config, arguments.workers, arguments.stop_timeout).run()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+
+#Service settings, read from environment variables so they can be changed per deployment without code changes
+
+def getBoolean(name, default):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+#Batch requests with at least this many records are weighted in the threadpool so they do not block the event loop; 0 weights every batch inline
+BATCH_OFFLOAD_THRESHOLD = int(os.getenv("BATCH_OFFLOAD_THRESHOLD", "1000"))
+
+#Decode request bodies with the lean validation path instead of the pydantic models; responses and validation errors are unchanged
+LEAN_VALIDATION = getBoolean("LEAN_VALIDATION", "false")
+
+#Number of rows the streaming endpoint and bulk_weighting.py weight at a time
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+
+#Record per-stage timings, request counts, and error counts, and serve them at /metrics
+METRICS_ENABLED = getBoolean("METRICS_ENABLED", "false")
+
+#Number of weighting results kept in the in-process result cache; 0 disables the cache
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "0"))
+
+#Seconds a cached weighting result is kept; 0 keeps results until they are evicted
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "0"))
+
+#max-age, in seconds, of the Cache-Control header sent with the cacheable GET weighting endpoints
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "604800"))
+
+#Path of a binary coefficient store built with coefficient_store.py, which is memory-mapped instead of loading the coefficient tables into each worker; empty uses the tables in coefficient_table.py
+COEFFICIENT_STORE_PATH = os.getenv("COEFFICIENT_STORE_PATH", "")
+
+#Seconds between checks for a replaced COEFFICIENT_STORE_PATH file, which is loaded and swapped in without restarting the workers; 0 disables reloading
+TABLES_RELOAD_INTERVAL = float(os.getenv("TABLES_RELOAD_INTERVAL", "0"))
+
+#Number of worker processes serve.py starts; 0 starts one per available core
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0"))
+
+#Serve the OpenAPI schema and the interactive docs; turning them off skips adding their routes and the response models that only document the responses, for deployments that only need the weighting endpoints
+DOCS_ENABLED = getBoolean("DOCS_ENABLED", "true")
+
+#Path of a CSV or NDJSON file of known SEP combinations (see weight_table.py) whose weights are precomputed, so weighting them skips the solve; empty solves every request
+WEIGHT_TABLE_PATH = os.getenv("WEIGHT_TABLE_PATH", "")
+
+#Largest number of Monte Carlo samples the sensitivity endpoint takes in one request
+SENSITIVITY_MAX_SAMPLES = int(os.getenv("SENSITIVITY_MAX_SAMPLES", "1000000"))
+
+#Let identical requests that are weighted in the threadpool at the same time share one computation and response
+COALESCE_REQUESTS = getBoolean("COALESCE_REQUESTS", "true")
+
+#Seconds the single-site POST endpoints wait to gather concurrent requests into one vectorized weighting call, ex. 0.001; 0 weights each request on its own
+MICROBATCH_WINDOW = float(os.getenv("MICROBATCH_WINDOW", "0"))
+
+#Number of gathered requests that are weighted at once without waiting for the rest of the window
+MICROBATCH_SIZE = int(os.getenv("MICROBATCH_SIZE", "64"))
@@ -0,0 +1,35 @@
+import asyncio
+
+######
+##
+## Single-flight request coalescing
+##
+######
+
+# Concurrent calls with the same key share one computation: the first call starts it as a task, and calls that arrive while it is running wait for the same task
+#  The task is not cancelled when the call that started it is, since other calls may be waiting for it
+#  Nothing is kept once the task finishes, so a later call with the same key computes again
+
+class SingleFlight:
+
+    def __init__(self):
+        self.tasks = {} # key -> asyncio.Task
+        self.coalesced = 0
+
+    # Returns await function(*arguments), sharing the call with any call of the same key that is still running
+    async def call(self, key, function, *arguments):
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function(*arguments))
+            self.tasks[key] = task
+            task.add_done_callback(lambda task: self.finish(key, task))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def finish(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        # Retrieves the exception so that a task whose callers were all cancelled is not logged as never retrieved
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,7 @@
+# The tests import the service modules from the repository root, as the benchmarks do
+#  Run from the repository root: python -m pytest tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
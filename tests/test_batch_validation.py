@@ -0,0 +1,54 @@
+# Batch records are validated one at a time: a record that is not a valid WeightEst fails only its own slot, with the same message with and without lean validation
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from lean_validation import compileRecordDecoder
+
+validRecord = {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}
+
+batch = [
+    validRecord,
+    dict(validRecord, x1="abc"),
+    {key: value for key, value in validRecord.items() if key != "regressionRegionCode"},
+    dict(validRecord, x1="abc", sep1=[1]),
+    None,
+    5,
+    validRecord,
+]
+
+expectedErrors = [
+    None,
+    "x1: value is not a valid float",
+    "regressionRegionCode: field required",
+    "x1: value is not a valid float; sep1: value is not a valid float",
+    "WeightEst expected dict not NoneType",
+    "WeightEst expected dict not int",
+    None,
+]
+
+@pytest.fixture(params=["pydantic", "lean"])
+def client(request, monkeypatch):
+    if request.param == "lean":
+        monkeypatch.setattr(main, "decodeBatchRecord", compileRecordDecoder(main.WeightEst))
+    else:
+        monkeypatch.setattr(main, "decodeBatchRecord", None)
+    return TestClient(main.app)
+
+def testInvalidRecordsFailOnlyTheirSlot(client):
+    response = client.post("/weightest/batch", json=batch)
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["error"] for result in results] == expectedErrors
+    assert [result["errorId"] for result in results] == [None if error is None else "invalid_input" for error in expectedErrors]
+    assert results[0] == results[6]
+    assert results[0]["Z"] is not None
+
+def testOffloadedBatchMatches(client, monkeypatch):
+    expected = client.post("/weightest/batch", json=batch).json()
+    monkeypatch.setattr(main.settings, "BATCH_OFFLOAD_THRESHOLD", 1)
+    assert client.post("/weightest/batch", json=batch).json() == expected
+
+def testBodyThatIsNotAListIs422(client):
+    assert client.post("/weightest/batch", json=validRecord).status_code == 422
@@ -0,0 +1,90 @@
+# CSV rows are read with the csv module across line endings, so quoted fields can contain newlines, in the stream endpoint and the command line tool
+
+import csv
+import io
+import json
+
+from starlette.testclient import TestClient
+
+import bulk_weighting
+import main
+from bulk_weighting import BulkWeighter
+
+header = "site,x1,x2,sep1,sep2,regressionRegionCode,code1,code2\r\n"
+rows = [
+    '"Upper\r\nCreek, at the bridge",122,8.24,0.483,0.376,GC1832,ACPK66_7AE,PK66_7AEP\r\n',
+    'Lower Creek,120,9.1,0.483,0.376,GC1832,ACPK66_7AE,PK66_7AEP\r\n',
+    '"Notes:\n\n""blank line"" above",abc,9.1,0.483,0.376,GC1832,ACPK66_7AE,PK66_7AEP\n',
+]
+body = header + "".join(rows)
+
+def readOutput(text):
+    return list(csv.DictReader(io.StringIO(text, newline="")))
+
+def checkOutput(output):
+    assert [row["site"] for row in output] == ["Upper\r\nCreek, at the bridge", "Lower Creek", 'Notes:\n\n"blank line" above']
+    assert [row["errorId"] for row in output] == ["", "", "invalid_input"]
+    assert output[0]["Z"] != "" and output[1]["Z"] != ""
+    assert output[2]["error"] == "x1: value is not a valid float"
+
+def testWeighterReadsQuotedNewlines():
+    weighter = BulkWeighter("csv", chunkSize=2)
+    lines = []
+    for line in io.StringIO(body, newline=""):
+        lines += weighter.feed(line)
+    lines += weighter.finish()
+    checkOutput(readOutput("".join(lines)))
+
+def testUnclosedQuoteIsAnErrorRow():
+    weighter = BulkWeighter("csv")
+    lines = []
+    for line in io.StringIO(header + rows[1] + '"never closed,122\n\n', newline=""):
+        lines += weighter.feed(line)
+    lines += weighter.finish()
+    output = readOutput("".join(lines))
+    assert [row["errorId"] for row in output] == ["", "invalid_input"]
+    assert output[1]["error"] == "Line is not valid CSV: unexpected end of data"
+
+def testStreamReadsQuotedNewlines():
+    #The body is sent in small chunks, so records are split across chunks as well as lines
+    data = body.encode("utf-8")
+    chunks = (data[start:start + 7] for start in range(0, len(data), 7))
+    response = TestClient(main.app).post("/weightest/stream", data=chunks, headers={"content-type": "text/csv"})
+    assert response.status_code == 200
+    checkOutput(readOutput(response.text))
+
+def testCommandLineReadsQuotedNewlines(tmp_path):
+    inputPath = tmp_path / "sites.csv"
+    outputPath = tmp_path / "results.csv"
+    inputPath.write_bytes(body.encode("utf-8"))
+    bulk_weighting.main([str(inputPath), "-o", str(outputPath)])
+    with open(outputPath, newline="") as outputFile:
+        checkOutput(readOutput(outputFile.read()))
+
+def postStream(data, contentType):
+    response = TestClient(main.app).post("/weightest/stream", data=data, headers={"content-type": contentType})
+    assert response.status_code == 200
+    return response.text
+
+def testStreamLineNotUTF8IsAnErrorRow():
+    data = (header + rows[1]).encode("utf-8") + b"Bad \x80 Creek,120,9.1,0.483,0.376,GC1832,ACPK66_7AE,PK66_7AEP\r\n" + rows[1].encode("utf-8")
+    output = readOutput(postStream(data, "text/csv"))
+    assert [row["errorId"] for row in output] == ["", "invalid_input", ""]
+    assert output[1]["error"].startswith("Line is not valid UTF-8")
+    assert output[2]["site"] == "Lower Creek"
+
+def testNDJSONLineNotUTF8IsAnErrorRow():
+    record = '{"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}\n'.encode("utf-8")
+    lines = postStream(record + b'{"site": "\xff"}\n' + record, "application/x-ndjson").splitlines()
+    assert [json.loads(line)["errorId"] for line in lines] == [None, "invalid_input", None]
+
+def testHeaderNotUTF8IsAnErrorRow():
+    output = readOutput(postStream(b"site,\xffx1\n" + rows[1].encode("utf-8"), "text/csv"))
+    assert output[0]["error"].startswith("Line is not valid UTF-8")
+    assert output[1]["error"] == "regressionRegionCode: field required"
+
+def testMissingRegionCodeMatchesBatch():
+    record = {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}
+    batchResult = TestClient(main.app).post("/weightest/batch", json=[record]).json()[0]
+    line = json.loads(postStream(json.dumps(record).encode("utf-8"), "application/x-ndjson"))
+    assert (line["error"], line["errorId"]) == (batchResult["error"], batchResult["errorId"]) == ("regressionRegionCode: field required", "invalid_input")
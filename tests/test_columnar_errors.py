@@ -0,0 +1,69 @@
+# Columnar request bodies that are not valid Arrow IPC or Parquet files, or have columns that cannot be read, are answered with a 4xx and an errorId instead of a 500
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+
+pa = pytest.importorskip("pyarrow")
+from columnar_weighting import mediaTypes, writeTable
+
+validTable = pa.table({
+    "x1": [122.0, 120.0],
+    "x2": [8.24, 9.1],
+    "sep1": [0.483, 0.483],
+    "sep2": [0.376, 0.376],
+    "regressionRegionCode": ["GC1832", "GC1832"],
+    "code1": ["ACPK66_7AE", "ACPK66_7AE"],
+    "code2": ["PK66_7AEP", "PK66_7AEP"],
+})
+
+client = TestClient(main.app)
+
+def postTable(data, format):
+    return client.post("/weightest/columnar", data=data, headers={"content-type": mediaTypes[format]})
+
+@pytest.mark.parametrize("format", list(mediaTypes))
+def testValidTableIsWeighted(format):
+    response = postTable(writeTable(validTable, format), format)
+    assert response.status_code == 200
+
+@pytest.mark.parametrize("format", list(mediaTypes))
+@pytest.mark.parametrize("cut", ["empty", "garbage", "half", "lastBytes"])
+def testInvalidBodyIs400(format, cut):
+    data = writeTable(validTable, format)
+    data = {"empty": b"", "garbage": b"not a table" * 10, "half": data[:len(data) // 2], "lastBytes": data[:-10]}[cut]
+    response = postTable(data, format)
+    assert response.status_code == 400
+    assert response.json()["errorId"] == "invalid_table"
+
+@pytest.mark.parametrize("field, array, errorId", [
+    ("x1", pa.array(["a", "b"]), "invalid_input"),
+    ("code1", pa.array([[1], [2]]), "invalid_input"),
+    ("regressionRegionCode", pa.array([b"\xff", b"\xfe"], pa.binary()), "invalid_input"),
+])
+def testMistypedColumnIs422(field, array, errorId):
+    table = validTable.set_column(validTable.column_names.index(field), field, array)
+    response = postTable(writeTable(table, "arrows"), "arrows")
+    assert response.status_code == 422
+    assert response.json()["errorId"] == errorId
+    assert response.json()["detail"].startswith(field + ": ")
+
+def testMissingRegionColumnIs422():
+    table = validTable.drop(["regressionRegionCode"])
+    response = postTable(writeTable(table, "arrows"), "arrows")
+    assert response.status_code == 422
+    assert response.json()["errorId"] == "invalid_input"
+
+def testLargeIntegersAreRounded():
+    table = validTable.set_column(0, "x1", pa.array([2 ** 60 + 1, 122]))
+    assert postTable(writeTable(table, "arrows"), "arrows").status_code == 200
+
+def testNullRegionCodeMatchesBatch():
+    from columnar_weighting import weightEstTable
+    table = validTable.set_column(validTable.column_names.index("regressionRegionCode"), "regressionRegionCode", pa.array(["GC1832", None]))
+    batchResults = client.post("/weightest/batch", json=[dict(zip(table.column_names, row)) for row in zip(*table.to_pydict().values())]).json()
+    for processes in (1, 2):
+        output = weightEstTable(table, processes)
+        assert output.column("errorId").to_pylist() == [result["errorId"] for result in batchResults] == [None, "invalid_input"]
+        assert output.column("error").to_pylist()[1] == "regressionRegionCode: field required"
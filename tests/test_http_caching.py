@@ -0,0 +1,36 @@
+# The cacheable GET endpoints answer conditional requests with 304 only for inputs that would be weighted, with the same caching headers as the 200 response
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+
+validQuery = {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}
+
+client = TestClient(main.app)
+
+cachingHeaders = ("etag", "cache-control", "access-control-expose-headers", "x-usgswim-table-version", "x-usgswim-messages")
+
+def testNotModifiedHasTheSameHeaders():
+    response = client.get("/weightest2/", params=validQuery)
+    assert response.status_code == 200
+    notModified = client.get("/weightest2/", params=validQuery, headers={"If-None-Match": response.headers["etag"]})
+    assert notModified.status_code == 304
+    assert notModified.content == b""
+    assert {name: notModified.headers.get(name) for name in cachingHeaders} == {name: response.headers.get(name) for name in cachingHeaders}
+    assert "ETag" in notModified.headers["access-control-expose-headers"]
+
+@pytest.mark.parametrize("query, errorId", [
+    (dict(validQuery, regressionRegionCode="XX"), "invalid_region"),
+    (dict(validQuery, x1="nan"), "nonfinite_value"),
+])
+def testInvalidInputsAre422EvenIfNoneMatchAny(query, errorId):
+    response = client.get("/weightest2/", params=query, headers={"If-None-Match": "*"})
+    assert response.status_code == 422
+    assert response.json()["errorId"] == errorId
+
+def testChangedInputsAreWeighted():
+    etag = client.get("/weightest2/", params=validQuery).headers["etag"]
+    response = client.get("/weightest2/", params=dict(validQuery, x1=123), headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
@@ -0,0 +1,76 @@
+# The lean validation decoders must reject bad request bodies with the same errors as pydantic
+
+import asyncio
+from typing import List
+
+import pytest
+from fastapi.dependencies.utils import request_body_to_args
+from fastapi.exceptions import RequestValidationError
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from starlette.testclient import TestClient
+
+from lean_validation import LeanValidationRoute, compileBodyDecoder
+from main import WeightEst, WeightEst2
+
+validRecord = {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}
+
+def getBodyField(bodyType):
+    async def endpoint(request_body: bodyType):
+        pass
+    return APIRoute("/", endpoint, methods=["POST"]).body_field
+
+# Returns the errors of the pydantic path and of the lean path for a decoded JSON body
+def getErrors(bodyField, body):
+    values, pydanticErrors = asyncio.run(request_body_to_args([bodyField], body))
+    leanErrors = []
+    compileBodyDecoder(bodyField)(body, leanErrors)
+    return RequestValidationError(pydanticErrors).errors(), RequestValidationError(leanErrors).errors()
+
+badRecords = {
+    "wrongType": dict(validRecord, x1="abc"),
+    "missingField": {key: value for key, value in validRecord.items() if key != "regressionRegionCode"},
+    "extraField": dict(validRecord, x9=1),
+    "nullValue": dict(validRecord, sep1=None),
+    "notADict": 5,
+}
+
+@pytest.mark.parametrize("name", list(badRecords))
+def testRecordErrorsMatchPydantic(name):
+    pydanticErrors, leanErrors = getErrors(getBodyField(WeightEst2), badRecords[name])
+    assert leanErrors == pydanticErrors
+
+@pytest.mark.parametrize("name", ["noneItem"] + list(badRecords))
+def testListErrorsMatchPydantic(name):
+    item = None if name == "noneItem" else badRecords[name]
+    body = [dict(validRecord, x3=None, x4=None, sep3=None, sep4=None, code3=None, code4=None), item]
+    pydanticErrors, leanErrors = getErrors(getBodyField(List[WeightEst]), body)
+    assert leanErrors == pydanticErrors
+
+def testValidListHasNoErrors():
+    pydanticErrors, leanErrors = getErrors(getBodyField(List[WeightEst]), [dict(validRecord)] * 2)
+    assert leanErrors == pydanticErrors == []
+
+# Returns a client of an app with the same endpoint handled by the regular route class or the lean one
+def getClient(routeClass):
+    app = FastAPI()
+    app.router.route_class = routeClass
+    @app.post("/")
+    async def endpoint(request_body: WeightEst2):
+        return {"x1": request_body.x1}
+    return TestClient(app)
+
+badBodies = {
+    "notUTF8": b"\x80abc",
+    "notJSON": b"{bad",
+    "empty": b"",
+}
+
+@pytest.mark.parametrize("name", list(badBodies))
+def testBadBodyResponsesMatchPydantic(name):
+    pydanticResponse, leanResponse = [
+        getClient(routeClass).post("/", data=badBodies[name], headers={"content-type": "application/json"})
+        for routeClass in (APIRoute, LeanValidationRoute)
+    ]
+    assert leanResponse.status_code == pydanticResponse.status_code
+    assert leanResponse.json() == pydanticResponse.json()
@@ -0,0 +1,34 @@
+# weightEstParallel gives the same results as weightEstBatch, including for NaN values, which are values and not missing methods
+
+import math
+
+import pytest
+
+pytest.importorskip("numpy")
+from ChannelWidthWeighting import weightEstBatch
+from parallel_weighting import weightEstParallel
+
+validRow = (122, 8.24, 45.9, None, 0.483, 0.376, 0.467, None, "GC1833", "ACPK66_7AE", "PK66_7AEP", "BWPK66_7AE", None)
+
+def replaceValue(row, index, value):
+    return row[:index] + (value,) + row[index + 1:]
+
+rows = [
+    validRow,
+    replaceValue(validRow, 0, math.nan),
+    replaceValue(validRow, 5, math.nan),
+    replaceValue(validRow, 1, math.inf),
+    replaceValue(replaceValue(replaceValue(validRow, 2, None), 6, None), 11, None),
+    (122, 8.24, 45.9, 26.6, 0.483, 0.376, 0.467, 0.538, "GC1834", "ACPK66_7AE", "PK66_7AEP", "BWPK66_7AE", "RSPK66_7AE"),
+    replaceValue(validRow, 8, "XX"),
+    replaceValue(validRow, 4, None),
+]
+
+@pytest.mark.parametrize("processes", [1, 2])
+def testParallelMatchesBatch(processes):
+    expected = weightEstBatch(rows)
+    assert [result[7] for result in expected] == [None, "nonfinite_value", "nonfinite_value", "nonfinite_value", None, None, "invalid_region", "missing_value"]
+    results = weightEstParallel(rows, processes, chunkSize=3)
+    assert [result[5:] for result in results] == [result[5:] for result in expected]
+    for result, expectedResult in zip(results, expected):
+        assert result[:5] == (pytest.approx(expectedResult[:5]) if expectedResult[0] is not None else expectedResult[:5])
@@ -0,0 +1,45 @@
+# weightEstSensitivity weights the methods selectMethods selects, with the perturbations of those methods
+
+import pytest
+
+pytest.importorskip("numpy")
+from ChannelWidthWeighting import droppedMethodWarning, weightEst, weightEstSensitivity
+
+xValues = [122, None, 3.1, 26.6]
+SEPValues = [0.483, None, 0.467, 0.538]
+codeValues = ["ACPK66_7AE", None, "BWPK66_7AE", "RSPK66_7AE"]
+
+def testUnperturbedResultMatchesWeightEst():
+    result, summaries = weightEstSensitivity(xValues, SEPValues, "GC1834", codeValues, numberSamples=10, seed=1)
+    assert result == weightEst(*xValues, *SEPValues, "GC1834", *codeValues)
+    assert summaries["Z"][1] == pytest.approx([result[0]] * 5)
+
+def testPerturbationsFollowTheirMethods():
+    #Only the method without an x value is given a perturbation, so no selected method is perturbed
+    result, summaries = weightEstSensitivity(xValues, SEPValues, "GC1834", codeValues, xSigmas=[None, 5.0, None, None], numberSamples=100, seed=1)
+    assert summaries["Z"][1] == pytest.approx([result[0]] * 5)
+    #The third method is perturbed, so the weighted estimate varies
+    result, summaries = weightEstSensitivity(xValues, SEPValues, "GC1834", codeValues, xSigmas=[None, None, 0.5, None], numberSamples=100, seed=1)
+    assert summaries["Z"][1][0] < result[0] < summaries["Z"][1][-1]
+
+def testDroppedMethodIsNotPerturbed():
+    fourX = [122, 8.24, 3.1, 26.6]
+    fourSEP = [0.483, 0.376, 0.467, 0.538]
+    fourCodes = ["ACPK66_7AE", "PK66_7AEP", "BWPK66_7AE", "RSPK66_7AE"]
+    #The fourth method has the highest SEP, so it is left out along with its perturbation
+    result, summaries = weightEstSensitivity(fourX, fourSEP, "GC1834", fourCodes, xSigmas=[None, None, None, 5.0], numberSamples=100, seed=1)
+    assert result[5].endswith(droppedMethodWarning)
+    assert summaries["Z"][1] == pytest.approx([result[0]] * 5)
+    result, summaries = weightEstSensitivity(fourX, fourSEP, "GC1834", fourCodes, xSigmas=[None, None, None, 5.0], numberSamples=100, seed=1, useAllMethods=True)
+    assert summaries["Z"][1][0] < result[0] < summaries["Z"][1][-1]
+
+def testNegativeSeedIsInvalid():
+    from weighting_errors import InvalidParameterError
+    with pytest.raises(InvalidParameterError):
+        weightEstSensitivity(xValues, SEPValues, "GC1834", codeValues, numberSamples=10, seed=-1)
+
+@pytest.mark.parametrize("sigmas", [{"xSigmas": 1e300}, {"SEPSigmas": 1e300}])
+def testOverflowingSamplesAreNonFinite(sigmas):
+    from weighting_errors import NonFiniteResultError
+    with pytest.raises(NonFiniteResultError):
+        weightEstSensitivity(xValues, SEPValues, "GC1834", codeValues, numberSamples=10, seed=1, **sigmas)
@@ -0,0 +1,37 @@
+# Responses must not depend on which serializer is installed: each request is sent with orjson and with the json fallback and the responses compared
+
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+
+validRecord = {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}
+
+requests = {
+    "valid": ("/weightest2/", [validRecord]),
+    "nanEstimate": ("/weightest2/", [dict(validRecord, x1="nan")]),
+    "infiniteEstimate": ("/weightest2/", [dict(validRecord, x1=1e400)]),
+    "nanSEP": ("/weightest2/", [dict(validRecord, sep1="nan")]),
+    #Finite estimates this large overflow the prediction interval, which batch weighting reports as an error row
+    "overflowingBatch": ("/weightest/batch", [[dict(validRecord, x1=1.7e308, x2=1.6e308), dict(validRecord, x1="nan")]]),
+}
+
+def postWithSerializer(monkeypatch, useOrjson, path, body):
+    if not useOrjson:
+        monkeypatch.setattr(main, "orjson", None)
+    #1e400 is infinite in Python, so it is put back into the JSON text as the number a client would send
+    data = json.dumps(body).replace("Infinity", "1e400")
+    response = TestClient(main.app).post(path, data=data, headers={"content-type": "application/json"})
+    monkeypatch.undo()
+    return response.status_code, response.json()
+
+@pytest.mark.parametrize("name", list(requests))
+def testJsonFallbackMatchesOrjson(monkeypatch, name):
+    path, (body,) = requests[name]
+    fallbackResponse = postWithSerializer(monkeypatch, False, path, body)
+    assert fallbackResponse[0] in (200, 422)
+    if main.orjson is None:
+        pytest.skip("orjson is not installed")
+    assert postWithSerializer(monkeypatch, True, path, body) == fallbackResponse
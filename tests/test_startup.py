@@ -0,0 +1,23 @@
+# Importing main does not import the modules of optional features that are not enabled, or the stream and columnar modules before their routes are requested
+
+import json
+import os
+import subprocess
+import sys
+
+repositoryDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+optionalModules = ["bulk_weighting", "columnar_weighting", "lean_validation", "micro_batching", "result_cache", "single_flight", "csv", "argparse", "numpy"]
+
+def getImportedModules(environment):
+    script = "import json, sys; import main; print(json.dumps([name for name in {} if name in sys.modules]))".format(optionalModules)
+    environment = dict(os.environ, **dict({"RESULT_CACHE_SIZE": "0", "COALESCE_REQUESTS": "false", "MICROBATCH_WINDOW": "0", "LEAN_VALIDATION": "false"}, **environment))
+    output = subprocess.run([sys.executable, "-c", script], cwd=repositoryDirectory, env=environment, capture_output=True, text=True, check=True).stdout
+    return json.loads(output)
+
+def testOptionalModulesAreNotImported():
+    assert getImportedModules({"DOCS_ENABLED": "false"}) == []
+
+def testEnabledFeaturesAreImported():
+    imported = getImportedModules({"DOCS_ENABLED": "false", "LEAN_VALIDATION": "true", "COALESCE_REQUESTS": "true"})
+    assert imported == ["lean_validation", "single_flight"]
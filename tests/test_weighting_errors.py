@@ -0,0 +1,112 @@
+# Invalid inputs raise typed weighting errors, answered with 422 and an errorId, and batch outputs carry the errorId of every row that could not be weighted
+
+import json
+import math
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from bulk_weighting import BulkWeighter
+from ChannelWidthWeighting import weightEst2, weightEstBatch
+from weighting_errors import NonFiniteResultError, NonFiniteValueError, NonPositiveEstimateError, NonPositiveSEPError, WeightingError
+
+validRecord = {"x1": 122, "x2": 8.24, "sep1": 0.483, "sep2": 0.376, "regressionRegionCode": "GC1832", "code1": "ACPK66_7AE", "code2": "PK66_7AEP"}
+validArguments = (122, 8.24, 0.483, 0.376, "GC1832", "ACPK66_7AE", "PK66_7AEP")
+
+client = TestClient(main.app)
+
+@pytest.mark.parametrize("index, value, errorType", [
+    (0, math.nan, NonFiniteValueError),
+    (0, math.inf, NonFiniteValueError),
+    (0, -math.inf, NonFiniteValueError),
+    (0, 0.0, NonPositiveEstimateError),
+    (2, math.nan, NonFiniteValueError),
+    (2, math.inf, NonFiniteValueError),
+    (2, -0.1, NonPositiveSEPError),
+])
+def testInvalidValuesRaiseTypedErrors(index, value, errorType):
+    arguments = list(validArguments)
+    arguments[index] = value
+    with pytest.raises(errorType):
+        weightEst2(*arguments)
+
+@pytest.mark.parametrize("field, value", [("x1", "nan"), ("x1", 1e400), ("sep1", "nan"), ("sep2", "-inf")])
+def testNonFiniteInputsAre422(field, value):
+    #1e400 is infinite in Python, so it is put back into the JSON text as the number a client would send
+    body = json.dumps(dict(validRecord, **{field: value})).replace("Infinity", "1e400")
+    response = client.post("/weightest2/", data=body, headers={"content-type": "application/json"})
+    assert response.status_code == 422
+    assert response.json() == {"detail": NonFiniteValueError.message, "errorId": "nonfinite_value"}
+
+def testInvalidRegionIs422WithErrorId():
+    response = client.post("/weightest2/", json=dict(validRecord, regressionRegionCode="XX"))
+    assert response.status_code == 422
+    assert response.json()["errorId"] == "invalid_region"
+
+def testBatchRowsHaveErrorIds():
+    rows = [
+        (122, 8.24, None, None, 0.483, 0.376, None, None, "GC1832", "ACPK66_7AE", "PK66_7AEP", None, None),
+        (math.nan, 8.24, None, None, 0.483, 0.376, None, None, "GC1832", "ACPK66_7AE", "PK66_7AEP", None, None),
+        (122, 8.24, None, None, 0.483, 0.376, None, None, "XX", "ACPK66_7AE", "PK66_7AEP", None, None),
+    ]
+    results = weightEstBatch(rows)
+    assert [result[7] for result in results] == [None, "nonfinite_value", "invalid_region"]
+    assert results[1][6] == NonFiniteValueError.message
+
+def testBatchResponseHasErrorIds():
+    response = client.post("/weightest/batch", json=[dict(validRecord), dict(validRecord, code2="ACPK66_7AEP")])
+    assert response.status_code == 200
+    assert [record["errorId"] for record in response.json()] == [None, "duplicate_method"]
+
+def testStreamRowsHaveErrorIds():
+    weighter = BulkWeighter("ndjson")
+    lines = []
+    for record in (validRecord, dict(validRecord, x1="abc"), dict(validRecord, sep1=-1)):
+        lines += weighter.feed(json.dumps(record))
+    lines += weighter.finish()
+    assert [json.loads(line)["errorId"] for line in lines] == [None, WeightingError.errorId, "nonpositive_sep"]
+
+def testColumnarOutputHasErrorIdColumn():
+    pa = pytest.importorskip("pyarrow")
+    from columnar_weighting import weightEstTable
+    table = pa.table({field: [validRecord[field], validRecord[field]] for field in validRecord})
+    table = table.set_column(table.column_names.index("x1"), "x1", pa.array([122.0, math.inf]))
+    assert weightEstTable(table).column("errorId").to_pylist() == [None, "nonfinite_value"]
+
+def testColumnarNaNIsNotMissing():
+    pa = pytest.importorskip("pyarrow")
+    from columnar_weighting import weightEstTable
+    table = pa.table({field: [validRecord[field]] * 3 for field in validRecord})
+    #A NaN estimate fails its row; a null one is a missing method, which leaves too few methods
+    table = table.set_column(table.column_names.index("x1"), "x1", pa.array([122.0, math.nan, None]))
+    table = table.set_column(table.column_names.index("sep2"), "sep2", pa.array([math.nan, 0.376, 0.376]))
+    for processes in (1, 2):
+        assert weightEstTable(table, processes).column("errorId").to_pylist() == ["nonfinite_value", "nonfinite_value", "missing_value"]
+
+def testCurveLengthMismatchIs422WithErrorId():
+    estimates = [
+        {"method": "AC", "x": [21.3, 33.4], "sep": [0.478, 0.456]},
+        {"method": "BC", "x": [6.18, 12.4], "sep": [0.581, 0.512]},
+    ]
+    response = client.post("/weightest/curve", json={"regressionRegionCode": "GC1832", "estimates": estimates})
+    assert response.status_code == 422
+    assert response.json()["errorId"] == "mismatched_length"
+
+def testOverflowingResultsAreFlagged():
+    arguments = (1.7e308, 1.6e308, 0.483, 0.376, "GC1832", "ACPK66_7AE", "PK66_7AEP")
+    with pytest.raises(NonFiniteResultError):
+        weightEst2(*arguments)
+    row = (1.7e308, 1.6e308, None, None, 0.483, 0.376, None, None, "GC1832", "ACPK66_7AE", "PK66_7AEP", None, None)
+    results = weightEstBatch([row, validArguments[:2] + (None, None) + validArguments[2:4] + (None, None) + validArguments[4:] + (None, None)])
+    assert results[0][6:] == (NonFiniteResultError.message, "nonfinite_result")
+    assert results[1][7] is None
+
+def testOverflowingCurveIs422():
+    estimates = [
+        {"method": method, "x": [x] * len(main.getCoefficientTables().AEPs), "sep": [sep] * len(main.getCoefficientTables().AEPs)}
+        for method, x, sep in (("AC", 1.7e308, 0.478), ("BC", 1.6e308, 0.581))
+    ]
+    response = client.post("/weightest/curve", json={"regressionRegionCode": "GC1832", "estimates": estimates})
+    assert response.status_code == 422
+    assert response.json()["errorId"] == "nonfinite_result"
@@ -0,0 +1,36 @@
+# Regression test of the Cholesky weighting engine (solveWeights, solveWeightsBatch) against stored reference outputs
+#  data/weighting_reference.json holds 300 sites of 2, 3, and 4 methods drawn with a fixed seed, with the results of the original
+#  expanded 2- and 3-method equations of weightEst2, weightEst3, and weightEst4, before the weights were solved from the covariance matrix
+
+import json
+import os
+
+import pytest
+
+from ChannelWidthWeighting import weightEst2, weightEst3, weightEst4, weightEstBatch
+
+relativeTolerance = 1e-9
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "weighting_reference.json")) as referenceFile:
+    referenceCases = json.load(referenceFile)
+
+weightingFunctions = {2: weightEst2, 3: weightEst3, 4: weightEst4}
+
+def assertMatchesReference(result, expected):
+    assert result[:5] == pytest.approx(expected[:5], rel=relativeTolerance)
+    assert result[5] == expected[5]
+
+@pytest.mark.parametrize("case", referenceCases)
+def testWeightEstMatchesReference(case):
+    function = weightingFunctions[len(case["x"])]
+    result = function(*case["x"], *case["sep"], case["regressionRegionCode"], *case["codes"])
+    assertMatchesReference(result, case["result"])
+
+def testWeightEstBatchMatchesReference():
+    rows = []
+    for case in referenceCases:
+        padding = [None] * (4 - len(case["x"]))
+        rows.append(tuple(case["x"] + padding + case["sep"] + padding + [case["regressionRegionCode"]] + case["codes"] + padding))
+    for result, case in zip(weightEstBatch(rows), referenceCases):
+        assert result[6] is None
+        assertMatchesReference(result[:6], case["result"])
@@ -0,0 +1,64 @@
+import argparse
+import csv
+import json
+
+from bulk_weighting import getFormat
+
+######
+##
+## Known SEP combinations for precomputed weights
+##
+######
+
+# Reads the combinations of regression region, statistic codes, and SEP values whose weights ChannelWidthWeighting precomputes (settings.WEIGHT_TABLE_PATH)
+#  The file is CSV or NDJSON with the same fields as the weightest endpoint request body: regressionRegionCode, code1-code4, and sep1-sep4
+#  x1-x4 and any other fields are ignored, so a bulk_weighting.py input file or a table of published regression equations can be used as it is
+# Each estimation method needs both a code and a SEP; rows with fewer than 2 methods are left out
+
+codeFields = ("code1", "code2", "code3", "code4")
+SEPFields = ("sep1", "sep2", "sep3", "sep4")
+
+# Returns a list of the distinct (regressionRegionCode, codes, SEP values) tuples in a CSV or NDJSON file
+def readSEPCombinations(path):
+    format = getFormat(path)
+    combinations = {}
+    with open(path, newline="") as combinationsFile:
+        if format == "csv":
+            records = csv.DictReader(combinationsFile)
+        else:
+            records = (json.loads(line) for line in combinationsFile if line.strip())
+        for lineNumber, record in enumerate(records, 1):
+            codes = []
+            SEPValues = []
+            for codeField, SEPField in zip(codeFields, SEPFields):
+                code = record.get(codeField)
+                SEP = record.get(SEPField)
+                if code is None or code == "" or SEP is None or SEP == "":
+                    continue
+                try:
+                    SEPValues.append(float(SEP))
+                except (TypeError, ValueError):
+                    raise ValueError(path + " record " + str(lineNumber) + ": " + SEPField + ": value is not a valid float")
+                codes.append(str(code))
+            regressionRegionCode = record.get("regressionRegionCode")
+            if regressionRegionCode and len(codes) >= 2:
+                combinations[(str(regressionRegionCode), tuple(codes), tuple(SEPValues))] = None
+    return list(combinations)
+
+def main(arguments = None):
+    from ChannelWidthWeighting import getCoefficientTables, getWeightTable, setSEPCombinations
+
+    parser = argparse.ArgumentParser(description="Check a CSV or NDJSON file of known SEP combinations by precomputing their weights with the current coefficient tables.")
+    parser.add_argument("input", help="file of regressionRegionCode, code1-code4, and sep1-sep4 rows")
+    arguments = parser.parse_args(arguments)
+
+    combinations = readSEPCombinations(arguments.input)
+    setSEPCombinations(combinations)
+    coefficientTables = getCoefficientTables()
+    weightTable = getWeightTable(coefficientTables)
+    #4 method combinations add a second entry without their highest SEP method
+    tabulated = sum(1 for regressionRegionCode, codes, SEPValues in combinations if (regressionRegionCode, codes, SEPValues) in weightTable)
+    print("Precomputed weights for {} of {} combinations ({} table entries) with table version {}".format(tabulated, len(combinations), len(weightTable), coefficientTables.version))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+######
+##
+## Weighting errors
+##
+######
+
+# Errors raised by ChannelWidthWeighting.py for inputs that cannot be weighted
+#  Each error type has a machine-readable errorId, the HTTP status code it is answered with, and its message
+#  They are ValueErrors, so code that catches ValueError keeps working
+# Batch weighting checks rows with functions that return an error type instead of raising it, so an invalid row costs no exception or traceback;
+#  the error type's errorId and message are then reported for the row
+
+class WeightingError(ValueError):
+    errorId = "invalid_input"
+    statusCode = 422
+    message = "Inputs could not be weighted."
+
+    def __init__(self, message = None):
+        #message replaces the error type's message, ex. to name the values that are missing
+        super().__init__(message or self.message)
+
+class InvalidRegionError(WeightingError):
+    errorId = "invalid_region"
+    message = "regressionRegionCode not valid."
+
+class InvalidMethodCodeError(WeightingError):
+    errorId = "invalid_method_code"
+    message = "Method in code not valid."
+
+class InvalidAEPCodeError(WeightingError):
+    errorId = "invalid_aep_code"
+    message = "AEP value could not be determined from code."
+
+class DuplicateCodeError(WeightingError):
+    errorId = "duplicate_code"
+    message = "codes must all be unique."
+
+class DuplicateMethodError(WeightingError):
+    errorId = "duplicate_method"
+    message = "Method in codes must all be unique."
+
+class MismatchedAEPError(WeightingError):
+    errorId = "mismatched_aep"
+    message = "AEP value must be the same for all flow statistics."
+
+class NonPositiveSEPError(WeightingError):
+    errorId = "nonpositive_sep"
+    message = "All SEP values must be greater than zero."
+
+#The message is the one math.log10 raised before the estimates were checked, which clients may already match on
+class NonPositiveEstimateError(WeightingError):
+    errorId = "nonpositive_estimate"
+    message = "math domain error"
+
+#NaN and infinite estimates or SEPs, ex. from "nan" or 1e400 in a request body
+class NonFiniteValueError(WeightingError):
+    errorId = "nonfinite_value"
+    message = "Estimates and SEP values must be finite numbers."
+
+#Finite estimates so large that the weighted estimate or its prediction interval is too large for a float, ex. 1.7e308
+class NonFiniteResultError(WeightingError):
+    errorId = "nonfinite_result"
+    message = "Weighted estimate or prediction interval is too large to be represented."
+
+class MissingCoefficientError(WeightingError):
+    errorId = "missing_coefficient"
+    message = "Coefficient could not be determined."
+
+class MissingSEPError(WeightingError):
+    errorId = "missing_value"
+    message = "SEP values were unavailable for corresponding flow statistic values."
+
+class MissingCodeError(WeightingError):
+    errorId = "missing_value"
+    message = "Code values were unavailable for corresponding flow statistic values."
+
+#weightEstCurve estimates and SEPs that are not given for every method at each AEP
+class MismatchedLengthError(WeightingError):
+    errorId = "mismatched_length"
+    message = "Estimates and SEP values must be provided for every method at each AEP."
+
+class TooFewMethodsError(WeightingError):
+    errorId = "missing_value"
+    message = "At least two estimation method values must be provided."
+
+class NotPositiveDefiniteError(WeightingError):
+    errorId = "not_positive_definite"
+    message = "Covariance matrix of the estimation methods is not positive definite."
+
+class InvalidParameterError(WeightingError):
+    errorId = "invalid_parameter"
+
+#A columnar request body that is not an Arrow IPC or Parquet file, or is truncated or corrupt
+class InvalidTableError(WeightingError):
+    errorId = "invalid_table"
+    statusCode = 400
+    message = "Input is not a valid Arrow IPC or Parquet file."
+
+# Every error type, ex. to list the error ids and messages
+errorTypes = (
+    InvalidRegionError,
+    InvalidMethodCodeError,
+    InvalidAEPCodeError,
+    DuplicateCodeError,
+    DuplicateMethodError,
+    MismatchedAEPError,
+    NonPositiveSEPError,
+    NonPositiveEstimateError,
+    NonFiniteValueError,
+    NonFiniteResultError,
+    MissingCoefficientError,
+    MissingSEPError,
+    MissingCodeError,
+    MismatchedLengthError,
+    TooFewMethodsError,
+    NotPositiveDefiniteError,
+    InvalidParameterError,
+    InvalidTableError,
+)